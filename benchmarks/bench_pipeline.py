@@ -0,0 +1,177 @@
+# benchmarks/bench_pipeline.py
+# Wall time and peak memory of each pipeline stage on synthetic logs of growing size, saved as
+# JSON and compared against a stored baseline (exit status 1 when a stage regressed).
+# Time is measured untraced with the pipeline's own parallelism; memory in a second, traced
+# pass run in a single process (tracemalloc slows allocations down ~10x and only sees the
+# current process).
+# Run from the repository root:
+#   python -m benchmarks.bench_pipeline --rows 10000 100000 1000000 --save-baseline
+#   python -m benchmarks.bench_pipeline --rows 10000 100000 1000000
+import argparse
+import copy
+import importlib
+import importlib.util
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import sklearn
+from src.anomaly_detection import detect_anomalies
+from src.data_loader import _load_cached, _with_source, apply_schema, read_log
+from src.plot_jobs import render_plots
+from src.preprocessing import preprocess
+from src.storage import write_processed
+from src.tags import tag_events
+from .synthetic_logs import write_synthetic_logs
+
+# getrusage only exists on Unix
+_resource = importlib.import_module("resource") if importlib.util.find_spec("resource") else None
+
+RESULTS = Path("benchmarks/results")
+PLOT_JOBS = [
+    {"plot": "plot_time_with_state_bands", "title": "bench", "savepath": "state_bands.png"},
+    {"plot": "plot_time_with_tag_markers", "savepath": "tag_markers.png"},
+    {"plot": "plot_anomalies", "savepath": "anomalies.png"},
+]
+
+
+def _load(files: list[Path]) -> pd.DataFrame:
+    return apply_schema(pd.concat([_with_source(read_log(f), f) for f in files], ignore_index=True))
+
+
+def _cached_load(files: list[Path], cache_dir: Path) -> pd.DataFrame:
+    dfs = _load_cached(files, cache_dir)
+    return apply_schema(pd.concat(dfs, ignore_index=True))
+
+
+def _plots(df: pd.DataFrame, folder: Path):
+    return render_plots(df, [dict(job, savepath=folder / job["savepath"]) for job in PLOT_JOBS], n_jobs=1)
+
+
+# Run fn and record its wall time. With memory_fn (fn restricted to one process), run it a
+# second time under tracemalloc for the peak of memory allocated during the call (Python
+# objects and NumPy/pandas buffers); frames are copied beforehand as stages may modify them.
+def _measure(fn, *args, memory_fn=None) -> tuple[object, dict]:
+    memory_args = copy.deepcopy(args) if memory_fn is not None else None
+    t0 = time.perf_counter()
+    result = fn(*args)
+    stats = {"seconds": time.perf_counter() - t0}
+    if memory_fn is not None:
+        tracemalloc.start()
+        memory_fn(*memory_args)
+        stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    if isinstance(result, pd.DataFrame):
+        stats["rows_out"] = len(result)
+        stats["frame_mb"] = result.memory_usage(deep=True).sum() / 2**20
+    return result, stats
+
+
+# Every stage of main.py on `rows` synthetic samples; plots are rendered serially
+def run_pipeline(rows: int, workdir: Path, trace_memory: bool = True, plots: bool = True) -> dict:
+    files = write_synthetic_logs(rows, workdir / "raw")
+    stats = {}
+
+    # `serial`: the stage in a single process, for the traced pass (default: the stage itself)
+    def stage(name, fn, *args, serial=None):
+        result, stats[name] = _measure(fn, *args, memory_fn=(serial or fn) if trace_memory else None)
+        print(f"  {name:<14} {stats[name]['seconds']:8.2f} s"
+              + (f" {stats[name]['peak_mb']:9.1f} MB peak" if trace_memory else ""))
+        return result
+
+    df = stage("load", _load, files)
+    _cached_load(files, workdir / "cache")  # fill the ingest cache
+    stage("load_cached", _cached_load, files, workdir / "cache")
+    df = stage("preprocess", preprocess, df, serial=partial(preprocess, n_jobs=1))
+    df = stage("tag_events", tag_events, df)
+    df = stage("detect", detect_anomalies, df, serial=partial(detect_anomalies, n_jobs=1))
+    stage("write_parquet", write_processed, df, workdir / "processed", "parquet")
+    if plots:
+        stage("plots", _plots, df, workdir / "plots")
+    return stats
+
+
+# Peak resident set size of this process and of its largest child process (pool workers), in MB
+def max_rss_mb() -> dict:
+    if _resource is None:
+        return {}
+    scale = 2**20 if platform.system() == "Darwin" else 2**10  # bytes on macOS, KiB on Linux
+    return {"self": _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss / scale,
+            "children": _resource.getrusage(_resource.RUSAGE_CHILDREN).ru_maxrss / scale}
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+        "sklearn": sklearn.__version__, "machine": platform.machine(), "cpus": os.cpu_count(),
+    }
+
+
+# Differences below these are timer/allocator noise, whatever the relative change
+NOISE_FLOOR = {"seconds": 0.05, "peak_mb": 1.0}
+
+
+# Stages slower (or with a higher peak) than the baseline by more than `tolerance`, as
+# (rows, stage, metric, baseline, current) tuples. Runs measured in different modes (with or
+# without the traced memory pass) are not comparable and raise ValueError.
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> list[tuple]:
+    if results.get("mode") != baseline.get("mode"):
+        raise ValueError(f"measurement mode {results.get('mode')} differs from the baseline's {baseline.get('mode')}")
+    regressions = []
+    for rows, stages in results["runs"].items():
+        for name, stats in stages.items():
+            base = baseline["runs"].get(rows, {}).get(name, {})
+            for metric, floor in NOISE_FLOOR.items():
+                if metric in stats and metric in base and stats[metric] - base[metric] > max(tolerance * base[metric], floor):
+                    regressions.append((int(rows), name, metric, base[metric], stats[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline benchmark on synthetic logs")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--out", type=Path, default=RESULTS / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=RESULTS / "baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced memory pass")
+    parser.add_argument("--no-plots", action="store_true")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "mode": {"memory": not args.no_memory}, "runs": {}}
+    for rows in args.rows:
+        print(f"rows={rows:,}")
+        with tempfile.TemporaryDirectory() as tmp:
+            results["runs"][str(rows)] = run_pipeline(rows, Path(tmp), not args.no_memory, not args.no_plots)
+    results["max_rss_mb"] = max_rss_mb()
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(results, indent=1))
+    print(f"Saved: {args.out}")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=1))
+        print(f"Saved baseline: {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print("No baseline to compare against (run with --save-baseline)")
+        return
+
+    try:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance)
+    except ValueError as exc:
+        raise SystemExit(f"Not compared: {exc}")
+    for rows, name, metric, base, current in regressions:
+        print(f"REGRESSION rows={rows:,} {name} {metric}: {base:.2f} -> {current:.2f} ({current / base - 1:+.0%})")
+    if regressions:
+        raise SystemExit(1)
+    print(f"No stage regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
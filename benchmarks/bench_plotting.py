@@ -0,0 +1,66 @@
+# benchmarks/bench_plotting.py
+# Render time of the plotting functions against row count, with and without line decimation.
+# Run from the repository root: python -m benchmarks.bench_plotting --rows 10000 100000 1000000
+import argparse
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src import plotting
+from src.config import IG_TAGS, CH_TAGS
+
+
+# Processed-like frame: pressures, IG states, CH tag flags and ~1% anomalies per channel
+def synthetic_plot_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    state = np.repeat(rng.choice(IG_TAGS, size=rows // 500 + 1), 500)[:rows]
+    df = pd.DataFrame({
+        "datetime": pd.date_range("2025-07-01", periods=rows, freq="s"),
+        "pressure_ion": 2e-7 * np.exp(np.cumsum(rng.normal(0, 0.01, rows))),
+        "pressure_conv": 1e-3 * np.exp(np.cumsum(rng.normal(0, 0.01, rows))),
+        "IG_state": pd.Categorical(state),
+        "anomaly_if_ion": np.where(rng.random(rows) < 0.01, -1, 1),
+        "anomaly_if_conv": np.where(rng.random(rows) < 0.01, -1, 1),
+    })
+    for tag in CH_TAGS:
+        df[f"tag_{tag.replace(' ', '_')}"] = (rng.random(rows) < 0.001).astype("uint8")
+    return df
+
+
+PLOTS = {
+    "events": lambda df, path: plotting.plot_time_with_events(df, savepath=path),
+    "state_bands": lambda df, path: plotting.plot_time_with_state_bands(df, title="bench", savepath=path),
+    "tag_markers": lambda df, path: plotting.plot_time_with_tag_markers(df, savepath=path),
+    "anomalies": lambda df, path: plotting.plot_anomalies(df, savepath=path),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot rendering benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--no-baseline", action="store_true", help="skip the undecimated runs")
+    args = parser.parse_args()
+
+    plotting.set_headless()
+    modes = {"decimated": plotting.PLOT_MAX_BUCKETS} if args.no_baseline else {"decimated": plotting.PLOT_MAX_BUCKETS, "all points": None}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            df = synthetic_plot_frame(rows)
+            for mode, buckets in modes.items():
+                plotting.set_decimation(buckets)
+                for name, plot in PLOTS.items():
+                    path = Path(tmp) / f"{name}.png"
+                    t0 = time.perf_counter()
+                    plot(df, path)
+                    results.append({"rows": rows, "mode": mode, "plot": name,
+                                    "seconds": time.perf_counter() - t0, "png_kb": path.stat().st_size / 1024})
+    plotting.set_decimation()
+
+    table = pd.DataFrame(results).pivot_table(index=["plot", "rows"], columns="mode", values="seconds")
+    print(table.to_string(float_format="{:.2f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/memory_report.py
+# Per-column memory of merged_all_raw_data.csv (and the tagged frame) with pandas inference
+# versus the declared schema in src/config.py.
+# Run from the repository root: python -m benchmarks.memory_report
+import argparse
+from pathlib import Path
+import pandas as pd
+from src.data_loader import read_log
+from src.tags import tag_events
+
+
+def _tagged_inferred(df: pd.DataFrame) -> pd.DataFrame:
+    # Previous dtypes of the tag stage: int64 flags and object states
+    out = tag_events(df.copy())
+    flags = [c for c in out.columns if c.startswith("tag_") and c != "tag_list"]
+    out[flags] = out[flags].astype("int64")
+    for col in ["IG_state", "CG_state", "CH_state"]:
+        out[col] = out[col].astype(object)
+    return out
+
+
+def memory_table(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    table = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "bytes_before": before.memory_usage(deep=True, index=False),
+    }).join(pd.DataFrame({
+        "dtype_after": after.dtypes.astype(str),
+        "bytes_after": after.memory_usage(deep=True, index=False),
+    }), how="outer")
+    table = table.fillna({"bytes_before": 0, "bytes_after": 0, "dtype_before": "-", "dtype_after": "-"})
+    table["saved_pct"] = 100 * (1 - table["bytes_after"] / table["bytes_before"].where(table["bytes_before"] > 0))
+    table.loc["TOTAL"] = ["", table["bytes_before"].sum(), "", table["bytes_after"].sum(),
+                          100 * (1 - table["bytes_after"].sum() / table["bytes_before"].sum())]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory report for the dtype schema")
+    parser.add_argument("--path", type=Path, default=Path("data/processed/merged_all_raw_data.csv"))
+    args = parser.parse_args()
+
+    inferred = pd.read_csv(args.path)
+    typed = read_log(args.path)
+    pd.set_option("display.width", 140)
+    print(f"Raw frame ({len(typed):,} rows)")
+    print(memory_table(inferred, typed).to_string(float_format="{:.1f}".format))
+    print()
+    print("Tagged frame")
+    print(memory_table(_tagged_inferred(inferred), tag_events(typed)).to_string(float_format="{:.1f}".format))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/synthetic_logs.py
+# Arduino-style raw logs (same columns, number format and tag vocabulary as data/raw/) for
+# benchmarks at sizes beyond the real history.
+# Run from the repository root: python -m benchmarks.synthetic_logs --rows 1000000 --out /tmp/logs
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from src.config import CH_TAGS
+
+COLUMNS = ["date", "time", "ion_analog", "voltage_ion", "pressure_ion",
+           "conv_analog", "voltage_conv", "pressure_conv", "tags"]
+# Gauge states are mostly steady; transitions and events are rare
+IG_WEIGHTS = {"IG on": 0.6, "IG off": 0.25, "IG fail": 0.03, "IG turn on": 0.05, "IG turn off": 0.05, "IG slow on": 0.02}
+CG_WEIGHTS = {"CG on": 0.9, "CG off": 0.04, "CG turn off": 0.03, "CG turn on": 0.03}
+CH_RATE = 0.05  # fraction of state runs that also carry a chamber tag
+
+
+def _choice(rng, weights: dict, size: int) -> np.ndarray:
+    p = np.array(list(weights.values()))
+    return rng.choice(list(weights), size=size, p=p / p.sum())
+
+
+# One log file of `rows` samples starting at `start`: 1 s cadence with occasional pauses,
+# tags constant over runs of ~5 min, ion readings missing while the ion gauge is off
+def synthetic_log(rows: int, start: pd.Timestamp, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    step = np.where(rng.random(rows) < 0.01, rng.integers(2, 60, rows), 1)
+    dt = start + pd.to_timedelta(np.cumsum(step) - step[0], unit="s")
+
+    run_id = np.cumsum(rng.random(rows) < 1 / 300)
+    n_runs = run_id[-1] + 1
+    tags = pd.Series(_choice(rng, IG_WEIGHTS, n_runs)).str.cat(_choice(rng, CG_WEIGHTS, n_runs), sep=", ")
+    ch = rng.random(n_runs) < CH_RATE
+    tags[ch] = tags[ch].str.cat(rng.choice(CH_TAGS, size=ch.sum()), sep=", ")
+    tags = pd.Categorical(tags)[run_id]
+
+    ion_analog = np.clip(np.round(440 + np.cumsum(rng.normal(0, 0.3, rows))), 0, 1023)
+    conv_analog = np.clip(np.round(194 + np.cumsum(rng.normal(0, 0.3, rows))), 0, 1023)
+    ion_off = np.isin(np.asarray(tags), [t for t in tags.categories if t.startswith(("IG off", "IG turn off"))])
+    ion_analog[ion_off] = np.nan
+
+    voltage_ion = ion_analog * 5 / 1023
+    voltage_conv = conv_analog * 5 / 1023
+    return pd.DataFrame({
+        "date": dt.strftime("%Y-%m-%d"),
+        "time": dt.strftime("%H:%M:%S"),
+        "ion_analog": pd.array(ion_analog, dtype="Int64"),
+        "voltage_ion": voltage_ion,
+        "pressure_ion": 10 ** (voltage_ion - 8.85),  # ~2e-7 Torr at the operating point
+        "conv_analog": pd.array(conv_analog, dtype="Int64"),
+        "voltage_conv": voltage_conv,
+        "pressure_conv": 10 ** (voltage_conv - 3.95),  # ~1e-3 Torr
+        "tags": tags,
+    }, columns=COLUMNS)
+
+
+# Write `rows` samples split over `files` logs, separated by pauses longer than SESSION_GAP
+def write_synthetic_logs(rows: int, folder: Path, files: int = 16, seed: int = 0) -> list[Path]:
+    folder.mkdir(parents=True, exist_ok=True)
+    sizes = np.full(files, rows // files)
+    sizes[: rows % files] += 1
+    start = pd.Timestamp("2025-06-23 14:06:02")
+    paths = []
+    for i, n in enumerate(sizes[sizes > 0]):
+        df = synthetic_log(int(n), start, seed=seed + i)
+        path = folder / f"arduino_data_log{start:%Y%m%d_%H%M%S}.csv"
+        df.to_csv(path, index=False, float_format="%.2E", na_rep="NaN")
+        paths.append(path)
+        start = pd.Timestamp(f"{df['date'].iloc[-1]} {df['time'].iloc[-1]}") + pd.Timedelta(days=1)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic Arduino logs")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--out", type=Path, required=True)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = write_synthetic_logs(args.rows, args.out, args.files, args.seed)
+    print(f"Wrote {args.rows:,} rows to {len(paths)} files in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
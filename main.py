@@ -1,31 +1,225 @@
 # main.py
-from src.data_loader import load_all_csv
-from src.config import DATA_RAW, DATA_PROCESSED, OUTPUT_PLOTS
-from src.plotting import plot_time_with_events, scatter_ion_vs_conv_by_state, plot_time_with_tag_markers, plot_time_with_state_bands, plot_anomalies
-from src.anomaly_detection import detect_anomalies
-from src.preprocessing import preprocess
-from src.tags import tag_events, tag_frequencies, combo_counts
-
-def main():
-    df = load_all_csv()
-    df = preprocess(df)
-    df = tag_events(df)
-    df = detect_anomalies(df)
-    processed_path = DATA_PROCESSED / "processed.csv"
-    df.to_csv(processed_path, index=False)
-    print(f"Saved: {processed_path}")
-
-    # High-level plots
-    plot_time_with_state_bands(df, title="Pressures with IG_state bands", savepath=OUTPUT_PLOTS  / "state_bands.png")
-    plot_time_with_tag_markers(df, title="Tag markers over time", savepath=OUTPUT_PLOTS / "tag_markers.png")
-    plot_anomalies(df, title="Anomaly overlay (IsolationForest)", savepath=OUTPUT_PLOTS / "anomalies_if.png")
-
-    #Tag stats
-    tag_freqs = tag_frequencies(df)
-    combo_counts_df = combo_counts(df)
-    tag_freqs.to_csv(DATA_PROCESSED / "tag_frequencies.csv", index=False)
-    combo_counts_df.to_csv(DATA_PROCESSED / "tag_combinations.csv", index=False)
+# Command line entry point. Heavy modules (pandas, sklearn, matplotlib) are imported inside
+# the commands that need them, and only after the path options are applied to src.config.
+#   python main.py                      # every stage (same as `python main.py all`)
+#   python main.py ingest               # parse new/changed raw logs only (cron)
+#   python main.py --root /srv/vacuum detect
+#   python main.py watch --poll 0.5
+#   python main.py episodes --tag "IG fail" --min-duration 5min --unexpected ion
+import argparse
+from src import config
+
+
+def detect(df):
+    from src.anomaly_detection import train, score
+
+    # Retrain on the full history and persist the models; live scoring loads them via src.live_scoring
+    models = train(df)
+    return score(df.copy(deep=False), models)
+
+
+def save_processed(df, path, csv_export=False):
+    from src.storage import write_processed
+
+    path = write_processed(df, path)
+    print(f"Saved: {path}")
+    if csv_export and path.suffix != ".csv":
+        df.to_csv(path.with_suffix(".csv"), index=False)
+        print(f"Saved: {path.with_suffix('.csv')}")
+
+
+def save_tag_stats(df, freq_path, combo_path):
+    from src.tags import tag_frequencies, combo_counts
+
+    freq_path.parent.mkdir(parents=True, exist_ok=True)
+    tag_frequencies(df).to_csv(freq_path, index=False)
+    combo_counts(df).to_csv(combo_path, index=False)
     print("Saved tag stats.")
 
+
+# Episode table written by the "episodes" stage (CSV when pyarrow is missing)
+def episodes_path():
+    from src.storage import HAS_PYARROW
+
+    return config.OUTPUT_TABLES / ("episodes.parquet" if HAS_PYARROW else "episodes.csv")
+
+
+# Print the saved episodes matching the query options (see EpisodeIndex.query)
+def query_episodes(args):
+    import pandas as pd
+    from src.episodes import load_episodes
+
+    index = load_episodes(episodes_path())
+    overlaps = None
+    if args.unexpected:
+        anomalies = index.query(kind="anomaly", label=args.unexpected)
+        overlaps = anomalies[anomalies[f"n_unexpected_{args.unexpected}"] > 0]
+    found = index.query(start=args.start, end=args.end, kind=args.kind, label=args.label, state=args.state,
+                        tag=args.tag, min_duration=args.min_duration, overlaps=overlaps)
+    with pd.option_context("display.max_rows", None, "display.width", None):
+        print(found[["kind", "label", "start", "end", "duration_s", "peak_score", "states", "tags"]].to_string(index=False))
+    print(f"{len(found)} of {len(index)} episodes")
+
+
+# Report plots, rendered in parallel by src.plot_jobs (keys other than "plot" are the plot arguments)
+def plot_jobs():
+    plots = config.OUTPUT_PLOTS
+    return [
+        {"plot": "plot_time_with_events", "savepath": plots / "pressure_over_time.png"},
+        {"plot": "plot_time_with_state_bands", "title": "Pressures with IG_state bands",
+         "savepath": plots / "state_bands.png"},
+        {"plot": "plot_time_with_tag_markers", "title": "Tag markers over time",
+         "savepath": plots / "tag_markers.png"},
+        {"plot": "plot_time_with_tag_markers", "tags_to_mark": ["IG fail", "IG turn on", "IG slow on"],
+         "title": "Markers: IG fail / turn on / slow on", "savepath": plots / "markers_fail_turnon_slowon_eng.png"},
+        {"plot": "plot_anomalies", "title": "Anomaly overlay (IsolationForest)",
+         "savepath": plots / "anomalies_if.png"},
+    ]
+
+
+# Each stage lists the stages it reads, the src.config values it depends on and its settings;
+# rerunning main() only recomputes stages affected by a change.
+def build_stages():
+    from src.anomaly_detection import CHANNELS, model_path
+    from src.data_loader import load_all_csv, raw_fingerprints
+    from src.episodes import export_episodes
+    from src.pipeline import Stage
+    from src.plot_jobs import render_plots
+    from src.preprocessing import preprocess
+    from src.storage import processed_path
+    from src.tags import tag_events, export_state_runs
+
+    out_path = processed_path(config.DATA_PROCESSED / "processed")
+    freq_path = config.DATA_PROCESSED / "tag_frequencies.csv"
+    combo_path = config.DATA_PROCESSED / "tag_combinations.csv"
+    runs_path = config.OUTPUT_TABLES / "state_runs.csv"
+    ep_path = episodes_path()
+    jobs = plot_jobs()
+    csv_export = config.PROCESSED_CSV_EXPORT
+    return [
+        Stage("load", load_all_csv, config=["DATA_RAW", "RAW_DTYPES", "RAW_TIMESTAMP_FORMAT"],
+              key_data=raw_fingerprints),
+        Stage("preprocess", preprocess, inputs=["load"],
+              config=["ROLL_WINDOWS", "SLOPE_WINDOW", "SESSION_GAP", "RESAMPLE_FREQ"]),
+        Stage("tags", tag_events, inputs=["preprocess"],
+              config=["IG_TAGS", "CG_TAGS", "CH_TAGS", "STATE_CATEGORIES", "TAG_FLAG_DTYPE"]),
+        Stage("detect", detect, inputs=["tags"],
+              config=["FEATURE_COLUMNS", "IF_RANDOM_STATE", "IF_CONTAMINATION", "IF_N_ESTIMATORS",
+                      "IDLE_KEEP_EVERY", "IDLE_LOG_TOL", "MODEL_DIR", "IF_TRAIN_MAX_ROWS", "IF_STRATA",
+                      "IF_MIN_STRATUM_ROWS", "DETECTORS", "DETECTOR_PARAMS", "IF_REGIMES", "IF_REGIME_MIN_ROWS"],
+              outputs=[model_path(channel) for channel in CHANNELS]),
+        Stage("save_processed", save_processed, inputs=["detect"],
+              config=["PROCESSED_FORMAT", "PROCESSED_PARTITION", "PROCESSED_COMPRESSION", "PROCESSED_ROW_GROUP_ROWS"],
+              params={"path": out_path, "csv_export": csv_export},
+              outputs=[out_path] + [out_path.with_suffix(".csv")] * csv_export),
+
+        # High-level plots
+        Stage("plots", render_plots, inputs=["detect"], config=["CH_TAGS", "PLOT_MAX_BUCKETS"],
+              params={"jobs": jobs, "n_jobs": config.PLOT_WORKERS}, outputs=[job["savepath"] for job in jobs]),
+
+        # Tag stats
+        Stage("tag_stats", save_tag_stats, inputs=["tags"],
+              params={"freq_path": freq_path, "combo_path": combo_path}, outputs=[freq_path, combo_path]),
+        # Run table of IG/CG/CH states for duration statistics
+        Stage("state_runs", export_state_runs, inputs=["tags"], config=["STATE_CATEGORIES"],
+              params={"path": runs_path}, outputs=[runs_path]),
+        # Intervals of anomalous or tagged samples, queried with `main.py episodes`
+        Stage("episodes", export_episodes, inputs=["detect"],
+              config=["EPISODE_MAX_GAP", "OP_tags", "ION_THRESHOLD", "CONV_THRESHOLD"],
+              params={"path": ep_path}, outputs=[ep_path]),
+    ]
+
+
+# Stages each command runs (plus the stages they read)
+COMMAND_STAGES = {
+    "features": ["tags"],
+    "detect": ["save_processed", "tag_stats", "state_runs", "episodes"],
+    "plot": ["plots"],
+    "all": None,
+}
+
+
+# The requested stages and the stages they depend on, in pipeline order
+def select_stages(stages: list, targets: list[str] | None) -> list:
+    if targets is None:
+        return stages
+    by_name = {stage.name: stage for stage in stages}
+    needed, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(by_name[name].inputs)
+    return [stage for stage in stages if stage.name in needed]
+
+
+def main(command: str = "all"):
+    from src.instrumentation import Instrumentation, sinks_from_config
+    from src.pipeline import run_stages
+
+    sinks = sinks_from_config()
+    stages = select_stages(build_stages(), COMMAND_STAGES[command])
+    run_stages(stages, instrumentation=Instrumentation(sinks) if sinks else None)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Vacuum diagnostics pipeline")
+    paths = parser.add_argument_group("paths (default: under the project root)")
+    paths.add_argument("--root", help="project root holding data/, outputs/ and models/")
+    paths.add_argument("--raw", help="folder of the raw Arduino logs")
+    paths.add_argument("--processed", help="folder of the processed outputs")
+    paths.add_argument("--plots", help="folder of the plots")
+    paths.add_argument("--tables", help="folder of the tables")
+    paths.add_argument("--models", help="folder of the trained models")
+    paths.add_argument("--cache", help="folder of the ingest cache (stage results go to <cache>/stages)")
+
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("ingest", help="parse new or changed raw logs into the ingest cache and merged export")
+    commands.add_parser("features", help="ingest, engineer features and derive tag states")
+    commands.add_parser("detect", help="train and score the detectors, write processed data and tag tables")
+    plot = commands.add_parser("plot", help="render the report plots (runs detect first if needed)")
+    plot.add_argument("--workers", type=int, help="plot processes (default: PLOT_WORKERS)")
+    commands.add_parser("all", help="every stage (default)")
+    watch = commands.add_parser("watch", help="score the newest raw log live with the saved models")
+    watch.add_argument("--poll", type=float, help="seconds between polls (default: LIVE_POLL_INTERVAL)")
+    watch.add_argument("--max-batch", type=int, help="max rows per poll (default: LIVE_MAX_BATCH)")
+    episodes = commands.add_parser("episodes", help="query the episode table written by detect")
+    episodes.add_argument("--start", help="episodes ending at or after this time")
+    episodes.add_argument("--end", help="episodes starting at or before this time")
+    episodes.add_argument("--kind", choices=["anomaly", "tag"])
+    episodes.add_argument("--label", help="channel (anomaly episodes) or tag (tag episodes)")
+    episodes.add_argument("--state", help="a state present during the episode, e.g. 'IG fail'")
+    episodes.add_argument("--tag", help="a tag present during the episode")
+    episodes.add_argument("--min-duration", help="e.g. 5min")
+    episodes.add_argument("--unexpected", choices=["ion", "conv"],
+                          help="only episodes overlapping unexpected anomalies of this channel")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None):
+    args = parse_args(argv)
+    config.set_paths(args.root, DATA_RAW=args.raw, DATA_PROCESSED=args.processed, OUTPUT_PLOTS=args.plots,
+                     OUTPUT_TABLES=args.tables, MODEL_DIR=args.models, INGEST_CACHE=args.cache,
+                     STAGE_CACHE=args.cache and f"{args.cache}/stages")
+    command = args.command or "all"
+    if command == "watch":
+        from src.live_scoring import watch
+
+        watch(poll_interval=args.poll or config.LIVE_POLL_INTERVAL, max_batch=args.max_batch or config.LIVE_MAX_BATCH)
+        return
+    if command == "ingest":
+        # only the new or changed logs are read; the history is never concatenated
+        from src.data_loader import ingest
+
+        ingest()
+        return
+    if command == "episodes":
+        query_episodes(args)
+        return
+    if command == "plot" and args.workers:
+        config.PLOT_WORKERS = args.workers
+    main(command)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    cli()
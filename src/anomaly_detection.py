@@ -1,51 +1,282 @@
 # src/anomaly_detection.py
+import hashlib
+import json
+import re
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from .config import IF_RANDOM_STATE, IF_CONTAMINATION, FEATURE_COLUMNS, OP_tags, CONV_THRESHOLD, ION_THRESHOLD
+import joblib
+from pathlib import Path
+from .config import (
+    IF_RANDOM_STATE, IF_CONTAMINATION, IF_N_ESTIMATORS, FEATURE_COLUMNS, MODEL_DIR,
+    OP_tags, CONV_THRESHOLD, ION_THRESHOLD, IDLE_KEEP_EVERY,
+    IF_TRAIN_MAX_ROWS, IF_STRATA, IF_MIN_STRATUM_ROWS, SCORE_CHUNK_ROWS, DETECTORS, DETECTOR_PARAMS,
+    IF_REGIMES, IF_REGIME_MIN_ROWS, IF_FIT_JOBS,
+)
+from .detectors import make_detector
+from .preprocessing import downsample_idle
 
 
-def detect_anomalies(df: pd.DataFrame) -> pd.DataFrame:
-    # Assume FEATURE_COLUMNS contains both ion and convectron features, e.g., "pressure_ion", "pressure_convectron"
-    ion_feats = [c for c in FEATURE_COLUMNS if "ion" in c and c in df.columns]
-    conv_feats = [c for c in FEATURE_COLUMNS if "conv" in c and c in df.columns]
+CHANNELS = ["ion", "conv"]
+GLOBAL = "*"  # name of the forest over all regimes
+FOREST_MANIFEST = "manifest.json"
+
+
+# Feature columns used by the model of one channel, in FEATURE_COLUMNS order
+def _channel_features(df: pd.DataFrame, channel: str) -> list[str]:
+    return [c for c in FEATURE_COLUMNS if channel in c and c in df.columns]
+
+
+# Float32, C-contiguous features with NaN/inf as 0: the layout the forest's trees work in,
+# so neither fit nor decision_function copies it again
+def _feature_matrix(df: pd.DataFrame, feats: list[str]) -> np.ndarray:
+    X = np.ascontiguousarray(df[feats].to_numpy(dtype=np.float32, na_value=np.nan))
+    X[~np.isfinite(X)] = 0.0
+    return X
+
+
+# Row positions of a random subsample of at most about max_rows rows, stratified by the
+# `strata` columns: each regime keeps its share of the rows, but at least min_rows (or all
+# of its rows), so rare regimes such as IG fail stay in the training set
+def stratified_sample(df: pd.DataFrame, max_rows: int, strata: list[str] = IF_STRATA,
+                      min_rows: int = IF_MIN_STRATUM_ROWS, seed: int = IF_RANDOM_STATE) -> np.ndarray:
+    n = len(df)
+    if n <= max_rows:
+        return np.arange(n)
+    strata = [c for c in strata if c in df.columns]
+    codes = (df.groupby(strata, observed=True, sort=False, dropna=False).ngroup().to_numpy() if strata
+             else np.zeros(n, dtype=int))
+    sizes = np.bincount(codes)
+    quota = np.minimum(sizes, np.maximum(np.ceil(max_rows * sizes / n), min_rows))
+    # keep the rows with the smallest random key of each stratum
+    rank = pd.Series(np.random.default_rng(seed).random(n)).groupby(codes).rank(method="first").to_numpy()
+    return np.flatnonzero(rank <= quota[codes])
+
+
+# sklearn is imported on first use: ingest and the lightweight detectors do not need it
+def _fit_forest(X: np.ndarray, n_jobs: int = -1):
+    from sklearn.ensemble import IsolationForest
+
+    model = IsolationForest(
+        n_estimators=IF_N_ESTIMATORS,
+        contamination=IF_CONTAMINATION,
+        random_state=IF_RANDOM_STATE,
+        n_jobs=n_jobs,
+        verbose=0,
+    )
+    return model.fit(X)
+
+
+def _regime_name(key) -> str:
+    return "|".join(map(str, key if isinstance(key, tuple) else (key,)))
+
+
+# Fingerprint of a forest's training set: features, training matrix and forest settings
+def _fingerprint(feats: list[str], X: np.ndarray) -> str:
+    h = hashlib.sha256(json.dumps([feats, IF_N_ESTIMATORS, IF_CONTAMINATION, IF_RANDOM_STATE]).encode())
+    h.update(X.tobytes())
+    return h.hexdigest()
+
+
+# Training sets of one channel, {forest name: (features, X)}: one forest per regime with at
+# least IF_REGIME_MIN_ROWS rows, subsampled within the regime only, plus the global forest
+# (GLOBAL) for the rows no regime forest scores. The global forest is trained on the rows of
+# the small regimes (and of regimes without a varying feature) plus the earliest
+# IF_MIN_STRATUM_ROWS rows of every other regime, so it also knows the common regimes for
+# unseen ones. Appending rows to a large regime leaves that set unchanged, so a training set
+# (and its fingerprint) only changes when its own regimes get new data. With no regimes the
+# global forest is the only one, on a stratified subsample of all rows.
+def _training_sets(df: pd.DataFrame, channel: str, max_rows: int | None, regimes: list[str]) -> dict:
+    feats = _channel_features(df, channel)
+    if not feats:
+        return {}
+    strata = df[[c for c in IF_STRATA if c in df.columns]]
+    cols = df.columns.get_indexer(feats)
+
+    # Features of the rows at `pos`, subsampled first so only the sampled rows are copied
+    def matrix(pos: np.ndarray) -> np.ndarray:
+        if max_rows and len(pos) > max_rows:
+            pos = pos[stratified_sample(strata.iloc[pos], max_rows)]
+        return _feature_matrix(df.iloc[pos, cols], feats)
+
+    if not regimes:
+        return {GLOBAL: (feats, matrix(np.arange(len(df))))}
+    sets, pool = {}, []
+    for key, pos in df.groupby(regimes, observed=True, dropna=False).indices.items():
+        if len(pos) < IF_REGIME_MIN_ROWS:
+            pool.append(pos)
+            continue
+        X = matrix(pos)
+        # flags constant within the regime (e.g. tag_IG_fail) carry no information there
+        keep = X.min(axis=0) != X.max(axis=0)
+        if keep.any():
+            sets[_regime_name(key)] = ([f for f, k in zip(feats, keep) if k], np.ascontiguousarray(X[:, keep]))
+            pool.append(pos[:IF_MIN_STRATUM_ROWS])  # indices are in row (time) order
+        else:
+            pool.append(pos)
+    return {GLOBAL: (feats, matrix(np.sort(np.concatenate(pool)))), **sets}
+
+
+# Fit the forests of all training sets {(channel, name): (features, X)} in parallel. With
+# cache_dir, forests whose training fingerprint matches the manifest are loaded instead,
+# so only regimes with new data are refitted.
+def _fit_forests(sets: dict, cache_dir: Path | None = None, n_jobs: int = IF_FIT_JOBS) -> dict:
+    manifest = {}
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = cache_dir / FOREST_MANIFEST
+        manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    fitted, todo, new_manifest = {}, [], {}
+    for (channel, name), (feats, X) in sets.items():
+        fp = _fingerprint(feats, X)
+        key = f"{channel}/{name}"
+        entry = manifest.get(key)
+        if entry and entry["fingerprint"] == fp and (cache_dir / entry["file"]).exists():
+            fitted[channel, name] = joblib.load(cache_dir / entry["file"])
+            new_manifest[key] = entry
+        else:
+            todo.append((channel, name, feats, X, fp))
+
+    # many small forests: one process each; a single forest: parallel trees instead
+    outer, inner = (n_jobs, 1) if len(todo) > 1 else (1, n_jobs)
+    models = joblib.Parallel(n_jobs=outer)(joblib.delayed(_fit_forest)(X, inner) for *_, X, _ in todo)
+    for (channel, name, feats, _, fp), model in zip(todo, models):
+        fitted[channel, name] = {"model": model, "features": feats}
+        if cache_dir is not None:
+            file = f"{channel}_{re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'global'}.joblib"
+            joblib.dump(fitted[channel, name], cache_dir / file)
+            new_manifest[f"{channel}/{name}"] = {"fingerprint": fp, "file": file}
+
+    if cache_dir is not None:
+        # regimes that no longer occur
+        for key in manifest.keys() - new_manifest.keys():
+            (cache_dir / manifest[key]["file"]).unlink(missing_ok=True)
+        manifest_path.write_text(json.dumps(new_manifest, indent=1))
+    print(f"Forests: {len(todo)} fitted, {len(sets) - len(todo)} unchanged")
+    return fitted
+
+
+# Fit the detector of each channel (DETECTORS). Each entry keeps the feature order it was
+# trained on. For IsolationForest, idle stretches are thinned out of the training rows first
+# (IDLE_KEEP_EVERY) and forests are fitted on stratified subsamples of at most
+# ~IF_TRAIN_MAX_ROWS rows: one per (IF_REGIMES) regime plus a global one, which scores
+# rows of regimes without their own forest. The lightweight detectors only learn a scale.
+def fit_models(df: pd.DataFrame, max_rows: int | None = IF_TRAIN_MAX_ROWS, detectors: dict = DETECTORS,
+               regimes: list[str] = IF_REGIMES, cache_dir: Path | None = None, n_jobs: int = IF_FIT_JOBS) -> dict:
+    models = {}
+    for channel in CHANNELS:
+        name = detectors.get(channel, "isolation_forest")
+        if name == "isolation_forest":
+            continue
+        detector = make_detector(name, **DETECTOR_PARAMS.get(name, {}))
+        feature = f"{detector.feature}_{channel}"
+        if feature in df.columns:
+            detector.fit(df[feature].to_numpy(dtype=float))
+            models[channel] = {"detector": detector, "features": [feature], "name": name}
+
+    forest_channels = [ch for ch in CHANNELS if detectors.get(ch, "isolation_forest") == "isolation_forest"]
+    if not forest_channels:
+        return models
+    if IDLE_KEEP_EVERY:
+        df = downsample_idle(df, IDLE_KEEP_EVERY)
+    regimes = [c for c in regimes or [] if c in df.columns]
+    sets = {}
+    for channel in forest_channels:
+        sets.update({(channel, name): data for name, data in _training_sets(df, channel, max_rows, regimes).items()})
+    fitted = _fit_forests(sets, cache_dir, n_jobs)
+    for channel in forest_channels:
+        if (channel, GLOBAL) not in fitted:
+            continue
+        models[channel] = {
+            **fitted[channel, GLOBAL], "name": "isolation_forest", "regime_cols": regimes,
+            "regimes": {name: entry for (ch, name), entry in fitted.items() if ch == channel and name != GLOBAL},
+        }
+    return models
+
+
+# File of the persisted detector of a channel
+def model_path(channel: str, model_dir: Path = MODEL_DIR, detectors: dict = DETECTORS) -> Path:
+    return model_dir / f"{detectors.get(channel, 'isolation_forest')}_{channel}.joblib"
+
+
+def save_models(models: dict, model_dir: Path = MODEL_DIR) -> None:
+    model_dir.mkdir(parents=True, exist_ok=True)
+    for channel, entry in models.items():
+        joblib.dump(entry, model_dir / f"{entry['name']}_{channel}.joblib")
+
+
+def load_models(model_dir: Path = MODEL_DIR, detectors: dict = DETECTORS) -> dict:
+    models = {}
+    for channel in CHANNELS:
+        path = model_path(channel, model_dir, detectors)
+        if path.exists():
+            models[channel] = joblib.load(path)
+    if not models:
+        raise FileNotFoundError(f"No trained models in {model_dir}, run train() first")
+    return models
+
+
+# Explicit retraining step: fit on the given history and persist the models. Forests are
+# cached per regime under model_dir/forests and only refitted when their training data changed.
+def train(df: pd.DataFrame, model_dir: Path = MODEL_DIR) -> dict:
+    models = fit_models(df, cache_dir=model_dir / "forests")
+    save_models(models, model_dir)
+    print(f"Models saved to {model_dir}")
+    return models
+
+
+def _forest_decision(entry: dict, df: pd.DataFrame) -> np.ndarray:
+    return entry["model"].decision_function(_feature_matrix(df, entry["features"]))
+
+
+# decision_function of a channel's forests over df, chunk_rows rows at a time (only one chunk
+# of features exists at once). Rows go to the forest of their regime, or the global one.
+def _decision(entry: dict, df: pd.DataFrame, chunk_rows: int) -> np.ndarray:
+    raw = np.empty(len(df))
+    regimes = entry.get("regimes")
+    cols = [c for c in entry.get("regime_cols", []) if c in df.columns]
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        out = raw[start:start + len(chunk)]
+        if not regimes or not cols:
+            out[:] = _forest_decision(entry, chunk)
+            continue
+        for key, pos in chunk.groupby(cols, observed=True, sort=False, dropna=False).indices.items():
+            out[pos] = _forest_decision(regimes.get(_regime_name(key), entry), chunk.iloc[pos])
+    return raw
+
+
+# Score rows with already fitted models (loaded from disk when not given), no refitting.
+# Labels come from the same decision pass as the scores (negative = anomaly, exactly what
+# IsolationForest.predict does). The anomaly_if_*/score_if_* columns hold the output of
+# whichever detector the channel uses. `states` (streaming): dict the lightweight detectors
+# keep their state in between calls, so successive batches score like one frame.
+def score(df: pd.DataFrame, models: dict | None = None, chunk_rows: int = SCORE_CHUNK_ROWS,
+          states: dict | None = None) -> pd.DataFrame:
+    if models is None:
+        models = load_models()
 
     # Detect anomalies separately for ion and convectron
-    if ion_feats:
-        X_ion = df[ion_feats].replace([np.inf, -np.inf], np.nan).fillna(0.0)
-        model_ion = IsolationForest(
-            n_estimators=300,
-            contamination=IF_CONTAMINATION,
-            random_state=IF_RANDOM_STATE,
-            n_jobs=-1,
-            verbose=0,
-        )
-        df["anomaly_if_ion"] = model_ion.fit_predict(X_ion)
-        df["score_if_raw_ion"] = model_ion.decision_function(X_ion)
-        df["score_if_ion"] = -df["score_if_raw_ion"]
-    else:
-        df["anomaly_if_ion"] = 1
-        df["score_if_raw_ion"] = 0.0
-        df["score_if_ion"] = 0.0
-
-    if conv_feats:
-        X_conv = df[conv_feats].replace([np.inf, -np.inf], np.nan).fillna(0.0)
-        model_conv = IsolationForest(
-            n_estimators=300,
-            contamination=IF_CONTAMINATION,
-            random_state=IF_RANDOM_STATE,
-            n_jobs=-1,
-            verbose=0,
-        )
-        df["anomaly_if_conv"] = model_conv.fit_predict(X_conv)
-        df["score_if_raw_conv"] = model_conv.decision_function(X_conv)
-        df["score_if_conv"] = -df["score_if_raw_conv"]
-    else:
-        df["anomaly_if_conv"] = 1
-        df["score_if_raw_conv"] = 0.0
-        df["score_if_conv"] = 0.0
-
-    # Only mark as anomaly if both ion and convectron agree
+    for channel in CHANNELS:
+        if channel in models:
+            entry = models[channel]
+            if "detector" in entry:
+                ids = df["session_id"].to_numpy() if "session_id" in df.columns else None
+                state = states.get(channel) if states is not None else None
+                raw, state = entry["detector"].decision(df[entry["features"][0]].to_numpy(dtype=float), ids, state)
+                if states is not None:
+                    states[channel] = state
+            else:
+                raw = _decision(entry, df, chunk_rows)
+            df[f"anomaly_if_{channel}"] = np.where(raw < 0, -1, 1)
+            df[f"score_if_raw_{channel}"] = raw
+            df[f"score_if_{channel}"] = -raw
+        else:
+            df[f"anomaly_if_{channel}"] = 1
+            df[f"score_if_raw_{channel}"] = 0.0
+            df[f"score_if_{channel}"] = 0.0
+
+    # Mark as anomaly if either ion or convectron flags the row
     df["anomaly_if"] = np.where(
         (df["anomaly_if_ion"] == -1) | (df["anomaly_if_conv"] == -1), -1, 1
     )
@@ -56,30 +287,39 @@ def detect_anomalies(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def tag_anomalies(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df["has_op_tag"] = df[OP_tags].any(axis=1)
+# Fit on df and score the same rows (one-off analysis, nothing is persisted)
+def detect_anomalies(df: pd.DataFrame, n_jobs: int = IF_FIT_JOBS) -> pd.DataFrame:
+    return score(df, fit_models(df, n_jobs=n_jobs))
 
-    # Classify ion anomalies
-    def classify_ion(row):
-        if row["anomaly_if_ion"] == -1 and row["has_op_tag"]:
-            return "operational"
-        elif row["anomaly_if_ion"] == -1 and not row["has_op_tag"] and row["pressure_ion"] > ION_THRESHOLD:
-            return "unexpected"
-        else:
-            return "normal"
-
-    # Classify convectron anomalies
-    def classify_conv(row):
-        if row["anomaly_if_conv"] == -1 and not row["has_op_tag"] and row["pressure_conv"] > CONV_THRESHOLD:
-            return "unexpected"
-        elif row["anomaly_if_conv"] == -1 and row["has_op_tag"]:
-            return "operational"
-        else:
-            return "normal"
 
-    df["anomaly_ion"] = df.apply(classify_ion, axis=1)
-    df["anomaly_conv"] = df.apply(classify_conv, axis=1)
+# Rule table for tag_anomalies: channel -> (pressure column, threshold above which an
+# anomaly without an operational tag is unexpected)
+ANOMALY_THRESHOLDS = {"ion": ("pressure_ion", ION_THRESHOLD), "conv": ("pressure_conv", CONV_THRESHOLD)}
+ANOMALY_CATEGORIES = pd.CategoricalDtype(["normal", "operational", "unexpected"])
 
 
+# Label IsolationForest anomalies per channel:
+#   operational - anomaly while one of op_tags is set
+#   unexpected  - anomaly without an operational tag and pressure above the channel threshold
+#   normal      - everything else
+# With inplace=True the columns are added to df itself instead of a shallow copy.
+def tag_anomalies(df: pd.DataFrame, op_tags: list[str] = OP_tags, thresholds: dict = ANOMALY_THRESHOLDS,
+                  inplace: bool = False) -> pd.DataFrame:
+    if not inplace:
+        df = df.copy(deep=False)
+    has_op_tag = df[op_tags].to_numpy().any(axis=1)
+    df["has_op_tag"] = has_op_tag
+
+    for channel, (pressure_col, threshold) in thresholds.items():
+        pressure = df[pressure_col].to_numpy()
+        # compare in the column's precision so a float32 reading equal to the threshold is not above it
+        above = pressure > np.asarray(threshold, dtype=pressure.dtype)
+        is_anomaly = df[f"anomaly_if_{channel}"].to_numpy() == -1
+        labels = np.select(
+            [is_anomaly & has_op_tag, is_anomaly & ~has_op_tag & above],
+            ["operational", "unexpected"],
+            default="normal",
+        )
+        df[f"anomaly_{channel}"] = pd.Categorical(labels, dtype=ANOMALY_CATEGORIES)
+
     return df
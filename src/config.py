@@ -1,27 +1,117 @@
+import os
 from pathlib import Path
 
-DATA_RAW = Path("../data/raw")
-DATA_PROCESSED = Path("../data/processed")
-OUTPUT_PLOTS = Path("../outputs/plots")
-OUTPUT_TABLES = Path("../outputs/tables")
+# All data, output and model folders live under the project root (override with VACUUM_ROOT,
+# or per folder with set_paths / the main.py options)
+ROOT = Path(os.environ.get("VACUUM_ROOT", Path(__file__).resolve().parent.parent))
+DATA_RAW = ROOT / "data" / "raw"
+DATA_PROCESSED = ROOT / "data" / "processed"
+OUTPUT_PLOTS = ROOT / "outputs" / "plots"
+OUTPUT_TABLES = ROOT / "outputs" / "tables"
+INGEST_CACHE = ROOT / "data" / "cache"  # parsed raw logs, keyed by file size and mtime
+MODEL_DIR = ROOT / "models"
+STAGE_CACHE = ROOT / "data" / "cache" / "stages"  # results of main.py stages, keyed by input and config hashes
+STAGE_CACHE_MAX_BYTES = 2 * 1024**3
 
 NUMERIC_COLS = [
     "ion_analog","voltage_ion","pressure_ion",
     "conv_analog","voltage_conv","pressure_conv",
 ]
 
+# Declared dtypes for the raw logs. Analog readings are 10-bit counts and voltages/pressures
+# are logged with 3 significant digits, so float32 (~7 digits) is exact enough and also
+# what IsolationForest works in internally. Analog counts stay float32 to keep NaN.
+RAW_DTYPES = {
+    "ion_analog": "float32", "voltage_ion": "float32", "pressure_ion": "float32",
+    "conv_analog": "float32", "voltage_conv": "float32", "pressure_conv": "float32",
+    "tags": "category", "source": "category",
+}
+RAW_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # date + " " + time columns
+TAG_FLAG_DTYPE = "uint8"
+
 IG_TAGS = ["IG on","IG off","IG fail","IG turn on","IG turn off", "IG slow on"]
 CG_TAGS = ["CG on", "CG off", "CG turn off", "CG turn on"]
 CH_TAGS = ["gate manipulation", "RP on", "chamber open", "venting"]
+# Categories of the derived state columns (tag order = priority, then the fallback)
+STATE_CATEGORIES = {
+    "IG_state": IG_TAGS + ["IG unknown"],
+    "CG_state": CG_TAGS + ["CG unknown"],
+    "CH_state": CH_TAGS + ["CH normal"],
+}
 OP_tags = ["tag_gate_manipulation", "tag_RP_on", "tag_chamber_open", "tag_venting"]
 
 ION_THRESHOLD = 1e-7  # Threshold for ion pressure to classify as unexpected
 CONV_THRESHOLD = 1e-3  # Threshold for convectron pressure to classify
+# Windows are counted in samples (int) or cover a time span (str such as "5min"). Time windows
+# mean the same real time at any cadence, and a time SLOPE_WINDOW gives slopes per second.
+# FEATURE_COLUMNS below must use the matching names (e.g. "roll5min_mean_ion").
 ROLL_WINDOWS = [3, 15]  # in samples (adapt to your sampling cadence)
 SLOPE_WINDOW = 5       # samples for rolling slope (linear trend)
+RESAMPLE_FREQ = None   # e.g. "30s": put each session on a uniform time grid before the features
+IDLE_KEEP_EVERY = None  # e.g. "10min": keep one sample per interval of idle stretches for training
+IDLE_LOG_TOL = 0.01    # |delta_log| below which a sample without tag change counts as idle
+SESSION_GAP = "30min"  # a longer pause between samples starts a new session
+PARALLEL_MIN_ROWS = 200_000  # smaller frames are preprocessed serially (pool startup dominates)
+
+# Processed output of main.py (src.storage): "parquet" or "arrow" (need pyarrow) or "csv"
+PROCESSED_FORMAT = "parquet"
+PROCESSED_PARTITION = "session"  # row groups never span two sessions ("date": two days; None)
+PROCESSED_COMPRESSION = "zstd"
+PROCESSED_ROW_GROUP_ROWS = 100_000
+PROCESSED_CSV_EXPORT = False  # also write processed.csv
+
+# Per-stage run records of main.py (src.instrumentation); None disables a sink
+INSTRUMENT_JSONL = None  # e.g. Path("../outputs/runs.jsonl"): one JSON line per stage run
+INSTRUMENT_PROM = None   # e.g. Path("../outputs/pipeline.prom"): Prometheus text file of the last run
+
+PLOT_MAX_BUCKETS = 2000  # lines keep first/last/min/max of this many runs (~pixel columns); None = all points
+PLOT_HEADLESS = False    # True: render with Agg, save files only, never call plt.show()
+PLOT_WORKERS = None      # processes rendering the main.py plots (None = one per CPU)
 
 IF_RANDOM_STATE = 42
 IF_CONTAMINATION = 0.01  # expected fraction of anomalies
+IF_N_ESTIMATORS = 300
+IF_TRAIN_MAX_ROWS = 200_000  # forests are fitted on a stratified subsample of this size (None = all rows)
+IF_STRATA = ["IG_state", "CG_state"]  # regimes the subsample is stratified by
+IF_MIN_STRATUM_ROWS = 500    # a regime keeps at least this many training rows (or all of them)
+SCORE_CHUNK_ROWS = 100_000   # rows scored at a time, bounds the feature matrix in memory
+IF_REGIMES = ["IG_state", "CG_state"]  # one forest per regime of these columns ([] = one global forest)
+IF_REGIME_MIN_ROWS = 256     # smaller regimes are scored by the global forest
+IF_FIT_JOBS = -1             # forests fitted in parallel (joblib processes)
+
+# Detector per channel: "isolation_forest", or a lightweight O(n) detector of sudden changes in
+# delta_log_<channel> (src/detectors.py): "robust_z" (rolling median/MAD z-score), "ewma"
+# (EWMA control chart) or "cusum" (drift/change points). Cheap ones suit the live path.
+DETECTORS = {"ion": "isolation_forest", "conv": "isolation_forest"}
+DETECTOR_PARAMS = {
+    "robust_z": {"window": 60, "threshold": 3.5},
+    "ewma": {"alpha": 0.05, "threshold": 4.0},
+    "cusum": {"k": 1.0, "h": 10.0},
+}
+
+# Episodes (src/episodes.py): flagged samples separated by at most this many unflagged samples
+# are merged into one episode, so a flickering anomaly flag gives one interval
+EPISODE_MAX_GAP = 2
+
+LIVE_POLL_INTERVAL = 1.0  # seconds between checks of the live log file
+LIVE_MAX_BATCH = 500      # max rows scored per poll, bounds the latency of one iteration
+
+
+# Move the project root and/or single folders, e.g. set_paths(MODEL_DIR="/srv/models").
+# Modules bind these paths as defaults when imported, so call this before importing them.
+def set_paths(root: str | Path | None = None, **paths: str | Path) -> None:
+    global ROOT, DATA_RAW, DATA_PROCESSED, OUTPUT_PLOTS, OUTPUT_TABLES, INGEST_CACHE, MODEL_DIR, STAGE_CACHE
+    if root is not None:
+        ROOT = Path(root)
+        DATA_RAW, DATA_PROCESSED = ROOT / "data" / "raw", ROOT / "data" / "processed"
+        OUTPUT_PLOTS, OUTPUT_TABLES = ROOT / "outputs" / "plots", ROOT / "outputs" / "tables"
+        INGEST_CACHE, STAGE_CACHE = ROOT / "data" / "cache", ROOT / "data" / "cache" / "stages"
+        MODEL_DIR = ROOT / "models"
+    for name, path in paths.items():
+        if name not in ("DATA_RAW", "DATA_PROCESSED", "OUTPUT_PLOTS", "OUTPUT_TABLES", "INGEST_CACHE", "MODEL_DIR", "STAGE_CACHE"):
+            raise ValueError(f"Unknown path setting {name!r}")
+        if path is not None:
+            globals()[name] = Path(path)
 
 
 FEATURE_COLUMNS = [
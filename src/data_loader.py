@@ -1,19 +1,152 @@
 # src/data_loader.py
+import importlib.util
+import json
 import pandas as pd
-from .config import DATA_RAW, DATA_PROCESSED
+from .config import DATA_RAW, DATA_PROCESSED, INGEST_CACHE, RAW_DTYPES, RAW_TIMESTAMP_FORMAT
 from pathlib import Path
 folder = DATA_RAW
-def load_all_csv() -> pd.DataFrame:
-    files = sorted(folder.glob("*.csv"))
-    dfs = []
+
+# Parquet needs pyarrow; without it parsed files are cached as pickles
+CACHE_FORMAT = "parquet" if importlib.util.find_spec("pyarrow") else "pickle"
+MANIFEST = "manifest.json"
+EXPORT_STATE = "merged_export.json"  # row offsets of each log in the merged CSV export
+# Cached pieces are only valid for the schema they were parsed with
+SCHEMA_KEY = json.dumps([RAW_DTYPES, RAW_TIMESTAMP_FORMAT], sort_keys=True)
+
+
+# Read one raw log with the declared schema; date + time become a single datetime column
+def read_log(source) -> pd.DataFrame:
+    df = pd.read_csv(source, dtype=RAW_DTYPES)
+    if "date" in df.columns and "time" in df.columns:
+        dt = pd.to_datetime(df["date"] + " " + df["time"], format=RAW_TIMESTAMP_FORMAT)
+        df = df.drop(columns=["date", "time"])
+        df.insert(0, "datetime", dt)
+    elif "datetime" in df.columns:
+        # merged export written by load_all_csv
+        df["datetime"] = pd.to_datetime(df["datetime"])
+    return df
+
+
+# Re-apply the schema after concatenation (categoricals with different categories become objects)
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype({c: t for c, t in RAW_DTYPES.items() if c in df.columns})
+
+
+def _fingerprint(f: Path) -> dict:
+    st = f.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+# Name, size and mtime of every raw log: changes whenever a log is added, modified or removed
+def raw_fingerprints() -> list[tuple]:
+    return [(f.name, *_fingerprint(f).values()) for f in sorted(folder.glob("*.csv"))]
+
+
+def _read_piece(path: Path) -> pd.DataFrame:
+    return pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_pickle(path)
+
+
+def _write_piece(df: pd.DataFrame, path: Path) -> None:
+    if path.suffix == ".parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_pickle(path)
+
+
+# Name of the log file each row came from, used to split the history into sessions
+def _with_source(df: pd.DataFrame, f: Path) -> pd.DataFrame:
+    df["source"] = f.stem
+    return df
+
+
+# Parse only new or changed CSVs into the columnar cache and return the cached piece of every
+# file (in file order). Unchanged files are not read.
+def _update_cache(files: list[Path], cache_dir: Path) -> list[Path]:
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = cache_dir / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+
+    new_manifest, pieces, changed = {}, [], False
     for f in files:
-        df = pd.read_csv(f)
-        dfs.append(df)
-    if not dfs:
+        key = str(f.resolve())
+        fp = _fingerprint(f)
+        entry = manifest.get(key)
+        piece = cache_dir / entry["piece"] if entry else None
+        if not (entry and entry["fingerprint"] == fp and entry.get("schema") == SCHEMA_KEY and piece.exists()):
+            df = read_log(f)
+            if piece is not None:
+                piece.unlink(missing_ok=True)
+            piece = cache_dir / f"{f.stem}.{CACHE_FORMAT}"
+            _write_piece(df, piece)
+            entry = {"fingerprint": fp, "schema": SCHEMA_KEY, "piece": piece.name}
+            changed = True
+        new_manifest[key] = entry
+        pieces.append(piece)
+
+    # Logs removed from the raw folder
+    for key in manifest.keys() - new_manifest.keys():
+        (cache_dir / manifest[key]["piece"]).unlink(missing_ok=True)
+        changed = True
+
+    if changed:
+        manifest_path.write_text(json.dumps(new_manifest, indent=1))
+    return pieces
+
+
+# Parsed frames of the files in file order, parsing only new or changed CSVs
+def _load_cached(files: list[Path], cache_dir: Path) -> list[pd.DataFrame]:
+    return [_with_source(_read_piece(piece), f) for f, piece in zip(files, _update_cache(files, cache_dir))]
+
+
+# Bring the merged CSV export up to date. It holds the logs in file order and the byte offset
+# where each log's rows start is kept in `state_path`, so only the rows from the first new,
+# changed or removed log onward are rewritten: a new daily log is appended, an unchanged
+# archive costs nothing.
+def _update_export(files: list[Path], pieces: list[Path], save_path: Path, state_path: Path) -> None:
+    keys = [[f.name, _fingerprint(f)] for f in files]
+    state = json.loads(state_path.read_text()) if state_path.exists() else {}
+    first, old = 0, []
+    if state.get("path") == str(save_path) and save_path.exists() and save_path.stat().st_size == state["size"]:
+        old = state["files"]
+        while first < min(len(old), len(keys)) and old[first] == keys[first]:
+            first += 1
+        if first == len(old) == len(keys):
+            return
+    offsets = state.get("offsets", [])[:first]
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(save_path, "r+b" if first else "wb") as fh:
+        if first:
+            fh.truncate(state["offsets"][first] if first < len(old) else state["size"])
+            fh.seek(0, 2)
+        for i in range(first, len(files)):
+            offsets.append(fh.tell())
+            df = apply_schema(_with_source(_read_piece(pieces[i]), files[i]))
+            fh.write(df.to_csv(index=False, header=i == 0).encode())
+        size = fh.tell()
+    state_path.write_text(json.dumps({"path": str(save_path), "size": size, "files": keys, "offsets": offsets}))
+    print(f"Combined data saved to {save_path} ({len(files) - first} of {len(files)} logs written)")
+
+
+# Ingest only: parse new or changed logs into the cache and update the merged export,
+# without loading the whole history
+def ingest() -> list[Path]:
+    files = sorted(folder.glob("*.csv"))
+    pieces = _update_cache(files, INGEST_CACHE)
+    _update_export(files, pieces, DATA_PROCESSED / "merged_all_raw_data.csv", INGEST_CACHE / EXPORT_STATE)
+    return pieces
+
+
+def load_all_csv(use_cache: bool = True) -> pd.DataFrame:
+    files = sorted(folder.glob("*.csv"))
+    if not files:
         return pd.DataFrame()
+    if use_cache:
+        dfs = [_with_source(_read_piece(piece), f) for f, piece in zip(files, ingest())]
+        return apply_schema(pd.concat(dfs, ignore_index=True))
     save_path = DATA_PROCESSED / "merged_all_raw_data.csv"
-    combined_df = pd.concat(dfs, ignore_index=True)
+    combined_df = apply_schema(pd.concat([_with_source(read_log(f), f) for f in files], ignore_index=True))
+    save_path.parent.mkdir(parents=True, exist_ok=True)
     combined_df.to_csv(save_path, index=False)
+    (INGEST_CACHE / EXPORT_STATE).unlink(missing_ok=True)  # the next cached run rewrites the export
     print(f"Combined data saved to {save_path}")
-
-    return pd.concat(dfs, ignore_index=True)
\ No newline at end of file
+    return combined_df
@@ -0,0 +1,135 @@
+# src/detectors.py
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from .config import IDLE_LOG_TOL
+
+
+# Lightweight per-channel detectors over one engineered feature (delta_log_<channel> by
+# default), O(n) and vectorized within each session. They follow the IsolationForest
+# convention of anomaly_detection.score: decision < 0 is an anomaly and larger is more normal.
+# `decision` also returns the state after the last row; passing it to the next call
+# continues the same session, which gives the streaming path the same result as one batch
+# call over all rows.
+
+
+def _session_bounds(ids: np.ndarray) -> np.ndarray:
+    return np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1, len(ids)]
+
+
+# Base class: subclasses implement _session; fit is optional (no reference level by default)
+class Detector(ABC):
+    feature = "delta_log"
+
+    def fit(self, x: np.ndarray) -> "Detector":
+        return self
+
+    # x: feature values; session_ids: session of each row (None = one session).
+    # Returns (decision, state).
+    def decision(self, x: np.ndarray, session_ids: np.ndarray | None = None, state: dict | None = None):
+        x = np.asarray(x, dtype=float)
+        ids = np.zeros(len(x), dtype=np.int64) if session_ids is None else np.asarray(session_ids)
+        if len(x) == 0:
+            return np.empty(0), state
+        bounds = _session_bounds(ids)
+        out = np.empty(len(x))
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            # only the first session of the call can continue the previous call
+            carried = state if a == 0 and state is not None and state.get("session") == ids[0] else None
+            out[a:b], state = self._session(x[a:b], carried)
+            state["session"] = ids[a]
+        return out, state
+
+    # Decision for the rows of one session, starting from `state` (None = session start)
+    @abstractmethod
+    def _session(self, x: np.ndarray, state: dict | None) -> tuple[np.ndarray, dict]:
+        ...
+
+
+# |x - median| / (1.4826 * MAD) over the previous `window` samples of the session. Robust to
+# the spikes it is looking for; the scale is floored at `min_scale` because quantized
+# pressures make delta_log exactly 0 for long stretches (MAD = 0).
+class RobustZDetector(Detector):
+    def __init__(self, window: int = 60, threshold: float = 3.5, min_periods: int = 10,
+                 min_scale: float = IDLE_LOG_TOL):
+        self.window, self.threshold, self.min_periods, self.min_scale = window, threshold, min_periods, min_scale
+
+    def _prev_median(self, s: pd.Series) -> np.ndarray:
+        # median of the `window` rows before each row (s holds one session)
+        return s.rolling(self.window, min_periods=self.min_periods).median().shift(1).to_numpy()
+
+    def _session(self, x, state):
+        # the last 2 * window values of the session are enough to rebuild median and MAD
+        prefix = state["tail"] if state is not None else np.empty(0)
+        xx = np.r_[prefix, x]
+        med = self._prev_median(pd.Series(xx))
+        dev = np.abs(xx - med)
+        mad = self._prev_median(pd.Series(dev))
+        z = dev / np.maximum(1.4826 * mad, self.min_scale)
+        z = np.nan_to_num(z[len(prefix):], nan=0.0)
+        return self.threshold - z, {"tail": xx[-2 * self.window:]}
+
+
+# EWMA control chart: deviation of x from the exponentially weighted mean of the previous
+# samples, in units of their exponentially weighted standard deviation
+class EWMADetector(Detector):
+    def __init__(self, alpha: float = 0.05, threshold: float = 4.0, min_scale: float = IDLE_LOG_TOL):
+        self.alpha, self.threshold, self.min_scale = alpha, threshold, min_scale
+
+    def _session(self, x, state):
+        from scipy.signal import lfilter
+
+        a = self.alpha
+        valid = ~np.isnan(x)
+        x = np.where(valid, x, 0.0)  # a missing reading counts as no change
+        m0, v0 = (state["m"], state["v"]) if state is not None else (x[0], 0.0)
+        # m_t = a x_t + (1 - a) m_{t-1};  v_t = (1 - a) (v_{t-1} + a (x_t - m_{t-1})^2)
+        m = lfilter([a], [1, a - 1], x, zi=[(1 - a) * m0])[0]
+        m_prev = np.r_[m0, m[:-1]]
+        err = x - m_prev
+        v = lfilter([(1 - a)], [1, a - 1], a * err**2, zi=[(1 - a) * v0])[0]
+        v_prev = np.r_[v0, v[:-1]]
+        z = np.abs(err) / np.maximum(np.sqrt(v_prev), self.min_scale)
+        if state is None:
+            z[0] = 0.0  # first sample of the session has no history
+        z[~valid] = 0.0
+        return self.threshold - z, {"m": m[-1], "v": v[-1]}
+
+
+# Two-sided CUSUM of the standardized feature: accumulates drifts of more than `k` standard
+# deviations and alarms above `h`. Catches slow leaks that single-sample tests miss.
+# The recursion S_t = max(0, S_{t-1} + y_t - k) is evaluated in closed form,
+# S_t = C_t - min(-S_0, min_{j<=t} C_j) with C the cumulative sum of y - k, so it stays
+# vectorized. There is no restart after an alarm: rows stay flagged while the drift persists.
+class CUSUMDetector(Detector):
+    def __init__(self, k: float = 1.0, h: float = 10.0, min_scale: float = IDLE_LOG_TOL):
+        self.k, self.h, self.min_scale = k, h, min_scale
+        self.mu, self.sigma = 0.0, min_scale
+
+    # Reference level and scale from training data (median and MAD)
+    def fit(self, x: np.ndarray) -> "CUSUMDetector":
+        x = np.asarray(x, dtype=float)
+        x = x[np.isfinite(x)]
+        if len(x):
+            self.mu = float(np.median(x))
+            self.sigma = max(1.4826 * float(np.median(np.abs(x - self.mu))), self.min_scale)
+        return self
+
+    def _one_sided(self, y: np.ndarray, s0: float) -> np.ndarray:
+        c = np.cumsum(y - self.k)
+        return c - np.minimum(-s0, np.minimum.accumulate(c))
+
+    def _session(self, x, state):
+        y = np.nan_to_num((x - self.mu) / self.sigma, nan=0.0)
+        pos = self._one_sided(y, state["pos"] if state is not None else 0.0)
+        neg = self._one_sided(-y, state["neg"] if state is not None else 0.0)
+        return self.h - np.maximum(pos, neg), {"pos": pos[-1], "neg": neg[-1]}
+
+
+DETECTOR_TYPES = {"robust_z": RobustZDetector, "ewma": EWMADetector, "cusum": CUSUMDetector}
+
+
+def make_detector(name: str, **params) -> Detector:
+    if name not in DETECTOR_TYPES:
+        raise ValueError(f"Unknown detector {name!r}, expected one of {list(DETECTOR_TYPES)} or 'isolation_forest'")
+    return DETECTOR_TYPES[name](**params)
@@ -0,0 +1,223 @@
+# src/episodes.py
+import numpy as np
+import pandas as pd
+from .config import EPISODE_MAX_GAP, STATE_CATEGORIES
+from .tags import ALL_TAGS, TAG_COLUMNS, STATE_TAGS
+
+CHANNELS = ["ion", "conv"]
+EPISODE_COLUMNS = [
+    "kind", "label", "session_id", "start", "end", "duration_s", "n_samples", "n_flagged",
+    "peak_score", "peak_time", *STATE_TAGS, "states", "tags",
+    *[f"n_unexpected_{channel}" for channel in CHANNELS],
+]
+
+
+# First and last row of each stretch of flagged rows; stretches separated by at most `max_gap`
+# unflagged rows are merged, and a stretch never spans two sessions
+def flag_runs(flag: np.ndarray, sessions: np.ndarray | None = None, max_gap: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rows = np.flatnonzero(flag)
+    if len(rows) == 0:
+        return rows, rows
+    split = np.diff(rows) > max_gap + 1
+    if sessions is not None:
+        split |= sessions[rows[1:]] != sessions[rows[:-1]]
+    cut = np.flatnonzero(split)
+    return rows[np.r_[0, cut + 1]], rows[np.r_[cut, len(rows) - 1]]
+
+
+# Per-segment sums of `values` over rows starts..ends (inclusive), from one cumulative sum
+def _segment_sums(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    cs = np.cumsum(values, dtype=np.int64)
+    return cs[ends] - cs[starts] + values[starts]
+
+
+# Per-segment position of the maximum of `values` over rows starts..ends (disjoint, sorted
+# segments; first row of the maximum, NaN counts as lowest)
+def _segment_argmax(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    v = np.where(np.isnan(values), -np.inf, values)
+    seg_max = np.maximum.reduceat(np.r_[v, -np.inf], np.c_[starts, ends + 1].ravel())[::2]
+    lengths = ends - starts + 1
+    seg = np.repeat(np.arange(len(starts)), lengths)
+    rows = np.arange(lengths.sum()) + np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    hit = v[rows] == seg_max[seg]
+    return rows[hit][np.unique(seg[hit], return_index=True)[1]]
+
+
+# Episodes of one flag column: interval, flagged rows and peak of `score` (None = no score)
+def _episodes(df: pd.DataFrame, kind: str, label: str, flag: np.ndarray, score: np.ndarray | None,
+              max_gap: int) -> pd.DataFrame:
+    sessions = df["session_id"].to_numpy() if "session_id" in df.columns else None
+    starts, ends = flag_runs(flag, sessions, max_gap)
+    out = {
+        "kind": kind, "label": label, "first": starts, "last": ends,
+        "session_id": sessions[starts] if sessions is not None else -1,
+        "n_flagged": _segment_sums(flag, starts, ends),
+        "peak": _segment_argmax(score, starts, ends) if score is not None else np.full(len(starts), -1),
+    }
+    return pd.DataFrame(out, index=pd.RangeIndex(len(starts)))
+
+
+# Describe episodes (first/last row positions) by the rows they span: the dominant IG/CG/CH
+# state, every state and tag present and the unexpected anomalies per channel. Each column is
+# summed once over all episodes, so the cost does not grow with the number of flag columns.
+def _describe(df: pd.DataFrame, episodes: pd.DataFrame) -> pd.DataFrame:
+    starts, ends = episodes["first"].to_numpy(), episodes["last"].to_numpy()
+    times = df["datetime"].to_numpy()
+    peak = episodes["peak"].to_numpy()
+    out = {
+        "start": times[starts], "end": times[ends], "n_samples": ends - starts + 1,
+        "peak_time": np.where(peak >= 0, times[peak], np.datetime64("NaT")),
+    }
+    present_states = [[] for _ in starts]
+    for col in STATE_TAGS:
+        if col not in df.columns:
+            out[col] = pd.Categorical([None] * len(starts), categories=STATE_CATEGORIES[col])
+            continue
+        codes = df[col].cat.codes.to_numpy()
+        counts = np.stack([_segment_sums(codes == k, starts, ends) for k in range(len(STATE_CATEGORIES[col]))], axis=1)
+        # episodes whose rows all lack the state get none (code -1) rather than the first category
+        dominant = np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1), -1)
+        out[col] = pd.Categorical.from_codes(dominant, categories=STATE_CATEGORIES[col])
+        for i, j in zip(*np.nonzero(counts)):
+            present_states[i].append(STATE_CATEGORIES[col][j])
+    present_tags = [[] for _ in starts]
+    for tag, col in zip(ALL_TAGS, TAG_COLUMNS):
+        if col in df.columns:
+            for i in np.flatnonzero(_segment_sums(df[col].to_numpy(), starts, ends)):
+                present_tags[i].append(tag)
+    out["states"] = [",".join(p) for p in present_states]
+    out["tags"] = [",".join(p) for p in present_tags]
+    for channel in CHANNELS:
+        col = f"anomaly_{channel}"
+        out[f"n_unexpected_{channel}"] = (_segment_sums((df[col] == "unexpected").to_numpy(), starts, ends)
+                                         if col in df.columns else 0)
+    return pd.DataFrame(out, index=episodes.index)
+
+
+# Merge the per-sample flags of a scored and tagged frame into episodes: one row per stretch
+# of anomalous samples per channel ("anomaly", label = channel) and per stretch of samples
+# carrying a tag ("tag", label = tag). Anomaly episodes peak on score_if_<channel>, tag
+# episodes on score_if. Rows are sorted by start.
+def build_episodes(df: pd.DataFrame, max_gap: int = EPISODE_MAX_GAP, tags: list[str] = ALL_TAGS) -> pd.DataFrame:
+    if "anomaly_ion" not in df.columns and "anomaly_if_ion" in df.columns and "tag_RP_on" in df.columns:
+        from .anomaly_detection import tag_anomalies
+
+        df = tag_anomalies(df)
+    parts, peak_scores = [], []
+    for channel in CHANNELS:
+        if f"anomaly_if_{channel}" in df.columns:
+            score = df[f"score_if_{channel}"].to_numpy(dtype=float)
+            parts.append(_episodes(df, "anomaly", channel, df[f"anomaly_if_{channel}"].to_numpy() == -1, score, max_gap))
+            peak_scores.append(score[parts[-1]["peak"].to_numpy()])
+    score = df["score_if"].to_numpy(dtype=float) if "score_if" in df.columns else None
+    for tag in tags:
+        col = TAG_COLUMNS[ALL_TAGS.index(tag)]
+        if col in df.columns:
+            parts.append(_episodes(df, "tag", tag, df[col].to_numpy() > 0, score, max_gap))
+            peak = parts[-1]["peak"].to_numpy()
+            peak_scores.append(score[peak] if score is not None else np.full(len(peak), np.nan))
+    if not parts:
+        return pd.DataFrame(columns=EPISODE_COLUMNS)
+    episodes = pd.concat(parts, ignore_index=True)
+    episodes = pd.concat([episodes, _describe(df, episodes)], axis=1)
+    episodes["peak_score"] = np.concatenate(peak_scores)
+    episodes["duration_s"] = (episodes["end"] - episodes["start"]).dt.total_seconds()
+    return episodes[EPISODE_COLUMNS].sort_values(["start", "end"], kind="stable", ignore_index=True)
+
+
+def _ns(t) -> int:
+    return pd.Timestamp(t).value
+
+
+# Interval index over an episode table for time-range, state and tag queries. Episodes are
+# kept sorted by start, with a sorted copy of the ends and the running maximum of the ends in
+# start order. The number of episodes overlapping [a, b] is #(start <= b) - #(end < a), two
+# binary searches. The episodes themselves lie between the first whose running maximum end
+# reaches a and the last starting by b (two binary searches); only that slice is checked row
+# by row.
+class EpisodeIndex:
+    def __init__(self, episodes: pd.DataFrame):
+        self.episodes = episodes.sort_values(["start", "end"], kind="stable", ignore_index=True)
+        self._starts = self.episodes["start"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+        self._ends = self.episodes["end"].to_numpy().astype("datetime64[ns]").astype(np.int64)
+        self._ends_sorted = np.sort(self._ends)
+        self._max_ends = np.maximum.accumulate(self._ends)
+
+    def __len__(self) -> int:
+        return len(self.episodes)
+
+    # Number of episodes overlapping each interval [a, b]
+    def count_overlaps(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return (np.searchsorted(self._starts, b, side="right")
+                - np.searchsorted(self._ends_sorted, a, side="left"))
+
+    # Mask of the episodes overlapping [start, end] (either bound may be None)
+    def _in_range(self, start=None, end=None) -> np.ndarray:
+        mask = np.zeros(len(self), dtype=bool)
+        hi = np.searchsorted(self._starts, _ns(end), side="right") if end is not None else len(self)
+        if start is None:
+            mask[:hi] = True
+            return mask
+        # every episode before lo ends before start
+        lo = np.searchsorted(self._max_ends, _ns(start), side="left")
+        if lo < hi:
+            mask[lo:hi] = self._ends[lo:hi] >= _ns(start)
+        return mask
+
+    # Episodes overlapping [start, end] that match every given filter:
+    #   kind/label      - "anomaly"/"tag" and the channel or tag of the episode
+    #   state / tag     - a state or tag present at some point of the episode
+    #   min_duration    - seconds or a timedelta string such as "5min"
+    #   overlaps        - another episode table or index; keep episodes intersecting one of its episodes
+    def query(self, start=None, end=None, kind: str | None = None, label: str | None = None,
+              state: str | None = None, tag: str | None = None, min_duration=None, overlaps=None) -> pd.DataFrame:
+        ep = self.episodes
+        mask = self._in_range(start, end)
+        if kind is not None:
+            mask &= (ep["kind"] == kind).to_numpy()
+        if label is not None:
+            mask &= (ep["label"] == label).to_numpy()
+        if state is not None:
+            mask &= _contains(ep["states"], state)
+        if tag is not None:
+            mask &= _contains(ep["tags"], tag)
+        if min_duration is not None:
+            seconds = pd.Timedelta(min_duration).total_seconds() if isinstance(min_duration, str) else min_duration
+            mask &= (ep["duration_s"] >= seconds).to_numpy()
+        if overlaps is not None:
+            other = overlaps if isinstance(overlaps, EpisodeIndex) else EpisodeIndex(overlaps)
+            rows = np.flatnonzero(mask)
+            mask[rows] = other.count_overlaps(self._starts[rows], self._ends[rows]) > 0
+        return ep[mask]
+
+    # Episodes in progress at time t
+    def at(self, t) -> pd.DataFrame:
+        return self.query(start=t, end=t)
+
+
+# Rows whose comma-separated list holds `item` (a whole entry, not a substring)
+def _contains(lists: pd.Series, item: str) -> np.ndarray:
+    return (("," + lists + ",").str.contains("," + item + ",", regex=False)).to_numpy()
+
+
+# Build the episodes of df and write them as Parquet for a .parquet path and as CSV otherwise
+def export_episodes(df: pd.DataFrame, path, max_gap: int = EPISODE_MAX_GAP) -> pd.DataFrame:
+    episodes = build_episodes(df, max_gap)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        episodes.to_parquet(path, index=False)
+    else:
+        episodes.to_csv(path, index=False)
+    print(f"Saved {len(episodes)} episodes: {path}")
+    return episodes
+
+
+def load_episodes(path) -> EpisodeIndex:
+    if str(path).endswith(".parquet"):
+        episodes = pd.read_parquet(path)
+    else:
+        episodes = pd.read_csv(path, parse_dates=["start", "end", "peak_time"], keep_default_na=False,
+                               na_values={"peak_score": [""], "peak_time": [""]})
+        for col in STATE_TAGS:
+            episodes[col] = pd.Categorical(episodes[col].replace("", None), categories=STATE_CATEGORIES[col])
+    return EpisodeIndex(episodes)
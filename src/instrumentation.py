@@ -0,0 +1,148 @@
+# src/instrumentation.py
+import importlib.util
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+import pandas as pd
+from .config import INSTRUMENT_JSONL, INSTRUMENT_PROM
+
+# Peak RSS comes from getrusage, which only exists on Unix
+_resource = importlib.import_module("resource") if importlib.util.find_spec("resource") else None
+
+
+# Peak resident set size of the process so far, in bytes (None where unavailable)
+def peak_rss() -> int | None:
+    if _resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss = _resource.getrusage(_resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def _rows(obj) -> int | None:
+    return len(obj) if isinstance(obj, pd.DataFrame) else None
+
+
+# Data-volume counts of a stage result: raw rows carrying tags, rows per derived state and
+# anomalies per channel, for whichever of those columns the frame has
+def frame_counts(df) -> dict:
+    if not isinstance(df, pd.DataFrame):
+        return {}
+    counts = {}
+    if "tags" in df.columns:
+        counts["tag_rows"] = int(df["tags"].notna().sum())
+    if "session_id" in df.columns:
+        counts["sessions"] = int(df["session_id"].nunique())
+    for col in ("IG_state", "CG_state", "CH_state"):
+        if col in df.columns:
+            counts.update({f"{col}={k}": int(v) for k, v in df[col].value_counts().items() if v})
+    for col in df.columns:
+        if col.startswith("anomaly_if_"):
+            counts[col] = int((df[col] == -1).sum())
+        elif col.startswith("anomaly_") and isinstance(df[col].dtype, pd.CategoricalDtype):
+            counts[f"{col}=unexpected"] = int((df[col] == "unexpected").sum())
+    return counts
+
+
+# Measures one stage run and emits its record to the sinks
+class StageTimer:
+    def __init__(self, sinks: list, run_id: str, stage: str):
+        self.sinks, self.run_id, self.stage = sinks, run_id, stage
+        self.t0 = time.perf_counter()
+
+    # `cached` is the metadata of a cached result: its rows and counts are those recorded
+    # when it was computed. `error` is the exception the stage raised.
+    def done(self, inputs: list = (), result=None, cached: dict | None = None,
+             error: BaseException | None = None) -> dict:
+        record = {
+            "run_id": self.run_id, "stage": self.stage, "time": time.time(), "cached": cached is not None,
+            "failed": error is not None, "error": repr(error) if error is not None else None,
+            "seconds": time.perf_counter() - self.t0,
+            "rows_in": sum(_rows(i) or 0 for i in inputs) if inputs else None,
+            "rows_out": cached.get("rows_out") if cached is not None else _rows(result),
+            "peak_rss_bytes": peak_rss(),
+            "counts": cached.get("counts", {}) if cached is not None else frame_counts(result),
+        }
+        for sink in self.sinks:
+            sink.emit(record)
+        return record
+
+
+# Hooks run_stages calls around each stage; records go to every sink. With no sinks,
+# `start` returns None and run_stages skips all measuring.
+class Instrumentation:
+    def __init__(self, sinks: list):
+        self.sinks = list(sinks)
+        self.run_id = uuid.uuid4().hex[:12]
+
+    def start(self, stage: str) -> StageTimer | None:
+        return StageTimer(self.sinks, self.run_id, stage) if self.sinks else None
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# Appends one JSON object per stage run to `path`
+class JsonLinesSink:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a")
+
+    def emit(self, record: dict):
+        self._fh.write(json.dumps(record) + "\n")
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+# Writes the last run as a Prometheus text file (for node_exporter's textfile collector).
+# The file is replaced atomically when the run closes, so scrapes never see a partial run.
+class PrometheusSink:
+    METRICS = {
+        "seconds": ("vacuum_stage_seconds", "Wall time of the stage"),
+        "rows_in": ("vacuum_stage_rows_in", "Rows of the stage inputs"),
+        "rows_out": ("vacuum_stage_rows_out", "Rows of the stage result"),
+        "cached": ("vacuum_stage_cached", "1 if the stage result came from the cache"),
+        "failed": ("vacuum_stage_failed", "1 if the stage raised"),
+        "peak_rss_bytes": ("vacuum_stage_peak_rss_bytes", "Peak RSS of the process after the stage"),
+    }
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.records = []
+
+    def emit(self, record: dict):
+        self.records.append(record)
+
+    def close(self):
+        lines = []
+        for key, (name, doc) in self.METRICS.items():
+            lines += [f"# HELP {name} {doc}", f"# TYPE {name} gauge"]
+            lines += [f'{name}{{stage="{r["stage"]}"}} {float(r[key])}' for r in self.records if r[key] is not None]
+        lines += ["# HELP vacuum_stage_count Data-volume counts of the stage result", "# TYPE vacuum_stage_count gauge"]
+        for r in self.records:
+            for count, value in r["counts"].items():
+                label = count.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'vacuum_stage_count{{stage="{r["stage"]}",count="{label}"}} {value}')
+        lines += ["# HELP vacuum_run_timestamp_seconds End of the last run", "# TYPE vacuum_run_timestamp_seconds gauge",
+                  f"vacuum_run_timestamp_seconds {time.time()}"]
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text("\n".join(lines) + "\n")
+        tmp.replace(self.path)
+
+
+# Sinks enabled in src/config.py (none by default)
+def sinks_from_config() -> list:
+    sinks = []
+    if INSTRUMENT_JSONL:
+        sinks.append(JsonLinesSink(INSTRUMENT_JSONL))
+    if INSTRUMENT_PROM:
+        sinks.append(PrometheusSink(INSTRUMENT_PROM))
+    return sinks
@@ -0,0 +1,119 @@
+# src/live_scoring.py
+import io
+import time
+from pathlib import Path
+import pandas as pd
+from .config import DATA_RAW, MODEL_DIR, LIVE_POLL_INTERVAL, LIVE_MAX_BATCH
+from .anomaly_detection import load_models, score
+from .data_loader import read_log
+from .streaming import StreamingFeatureEngine
+from .tags import tag_events
+
+SCORE_COLS = ["datetime", "pressure_ion", "pressure_conv", "anomaly_if_ion", "score_if_ion",
+              "anomaly_if_conv", "score_if_conv", "anomaly_if"]
+
+
+# Newest Arduino log (file names carry the start timestamp)
+def newest_log(folder: Path = DATA_RAW) -> Path | None:
+    files = sorted(folder.glob("*.csv"))
+    return files[-1] if files else None
+
+
+def _print_scores(scored: pd.DataFrame) -> None:
+    for row in scored[SCORE_COLS].itertuples(index=False):
+        flag = "ANOMALY" if row.anomaly_if == -1 else "ok"
+        print(f"{row.datetime}  ion={row.pressure_ion:.3g} ({row.score_if_ion:+.3f})  "
+              f"conv={row.pressure_conv:.3g} ({row.score_if_conv:+.3f})  {flag}")
+
+
+# Follows a CSV log as it grows and returns complete new lines as a DataFrame
+class LogTail:
+    def __init__(self, path: Path):
+        self.path = path
+        self._fh = open(path, "r", newline="")
+        self.header = self._fh.readline()
+        self._partial = ""
+
+    def existing(self) -> pd.DataFrame:
+        # Rows already in the file when tailing starts; leaves the position at the end.
+        # A last line still being written is held back like in read().
+        lines = self._fh.readlines()
+        if lines and not lines[-1].endswith("\n"):
+            self._partial = lines.pop()
+        return self._parse(lines)
+
+    def read(self, max_rows: int) -> pd.DataFrame:
+        lines = []
+        while len(lines) < max_rows:
+            line = self._fh.readline()
+            if not line:
+                break
+            line = self._partial + line
+            if not line.endswith("\n"):
+                # the logger is still writing this row
+                self._partial = line
+                break
+            self._partial = ""
+            lines.append(line)
+        return self._parse(lines)
+
+    def _parse(self, lines: list[str]) -> pd.DataFrame:
+        lines = [l for l in lines if l.strip()]
+        if not lines:
+            return pd.DataFrame()
+        return read_log(io.StringIO(self.header + "".join(lines)))
+
+    def close(self):
+        self._fh.close()
+
+
+# Rows the feature engine needs to continue after `logged`: the last `history` samples, or
+# every row within the longest time window when windows are time spans
+def warm_up_rows(logged: pd.DataFrame, engine: StreamingFeatureEngine) -> pd.DataFrame:
+    rows = logged.tail(engine.history)
+    if engine.time_history is not None:
+        recent = logged[logged["datetime"] >= logged["datetime"].iloc[-1] - engine.time_history]
+        if len(recent) > len(rows):
+            rows = recent
+    return rows
+
+
+# Tail the newest raw log and score every new row with the persisted models.
+# Each poll handles at most LIVE_MAX_BATCH rows, so one iteration has bounded latency.
+# When the logger starts a new file, scoring switches to it with a fresh feature state.
+def watch(folder: Path = DATA_RAW, model_dir: Path = MODEL_DIR, on_scores=_print_scores,
+          poll_interval: float = LIVE_POLL_INTERVAL, max_batch: int = LIVE_MAX_BATCH):
+    models = load_models(model_dir)
+    stateful = {ch: entry for ch, entry in models.items() if "detector" in entry}
+    tail, engine = None, None
+    try:
+        while True:
+            path = newest_log(folder)
+            if path is not None and (tail is None or path != tail.path):
+                if tail is not None:
+                    tail.close()
+                print(f"Watching {path}")
+                tail, engine, states = LogTail(path), StreamingFeatureEngine(), {}
+                # warm up the rolling state with the end of what is already logged; stateful
+                # detectors (EWMA, CUSUM, ...) replay the whole log to reach their current state
+                logged = tail.existing()
+                if not logged.empty and stateful:
+                    score(tag_events(engine.update(logged)), stateful, states=states)
+                elif not logged.empty:
+                    engine.update(warm_up_rows(logged, engine))
+
+            batch = tail.read(max_batch) if tail is not None else pd.DataFrame()
+            if batch.empty:
+                time.sleep(poll_interval)
+                continue
+            scored = score(tag_events(engine.update(batch)), models, states=states)
+            on_scores(scored)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tail is not None:
+            tail.close()
+
+
+if __name__ == "__main__":
+    watch()
@@ -0,0 +1,146 @@
+# src/pipeline.py
+import hashlib
+import json
+import os
+import pickle
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+import pandas as pd
+from . import config
+from .config import STAGE_CACHE, STAGE_CACHE_MAX_BYTES
+from .instrumentation import Instrumentation
+
+
+# One pipeline step: func(*outputs of `inputs`, **params). The cache key covers the stage
+# name, params, the `config` values it reads, the content hash of each input and, for stages
+# that read outside data, `key_data()`. A stage whose key is unchanged (and whose `outputs`
+# files still exist) is not run again.
+@dataclass
+class Stage:
+    name: str
+    func: Callable
+    inputs: list[str] = field(default_factory=list)
+    config: list[str] = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    outputs: list[Path] = field(default_factory=list)  # files written as a side effect
+    key_data: Callable | None = None
+
+
+# Content hash of a stage result
+def data_hash(obj) -> str:
+    h = hashlib.sha256()
+    if isinstance(obj, pd.DataFrame):
+        h.update(repr([(c, str(t)) for c, t in obj.dtypes.items()]).encode())
+        try:
+            h.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+        except TypeError:
+            # unhashable cells (e.g. tag_list)
+            h.update(pickle.dumps(obj))
+    else:
+        h.update(pickle.dumps(obj))
+    return h.hexdigest()
+
+
+# Pickled stage results under `root`, evicted least recently used first beyond `max_bytes`
+class StageCache:
+    def __init__(self, root: Path = STAGE_CACHE, max_bytes: int = STAGE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        root.mkdir(parents=True, exist_ok=True)
+
+    def meta(self, key: str) -> dict | None:
+        path = self.root / f"{key}.json"
+        if not path.exists() or not (self.root / f"{key}.pkl").exists():
+            return None
+        return json.loads(path.read_text())
+
+    def load(self, key: str):
+        path = self.root / f"{key}.pkl"
+        os.utime(path)  # recently used
+        with open(path, "rb") as fh:
+            return pickle.load(fh)
+
+    def touch(self, key: str) -> None:
+        os.utime(self.root / f"{key}.pkl")
+
+    def put(self, key: str, value, meta: dict, keep: set[str] = frozenset()) -> None:
+        with open(self.root / f"{key}.pkl", "wb") as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        (self.root / f"{key}.json").write_text(json.dumps(meta))
+        self.evict(keep=keep | {key})
+
+    def evict(self, keep: set[str] = frozenset()) -> None:
+        entries = sorted(self.root.glob("*.pkl"), key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in entries)
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path.stem in keep:
+                continue
+            total -= path.stat().st_size
+            path.unlink()
+            (self.root / f"{path.stem}.json").unlink(missing_ok=True)
+
+
+def _stage_key(stage: Stage, input_hashes: list[str]) -> str:
+    parts = {
+        "stage": stage.name,
+        "params": repr(sorted(stage.params.items())),
+        "config": repr([(k, getattr(config, k)) for k in stage.config]),
+        "inputs": input_hashes,
+        "data": repr(stage.key_data()) if stage.key_data else None,
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+# Run stages in the given (topological) order, recomputing only those whose key changed.
+# Results of cached stages are only loaded from disk when a recomputed stage needs them.
+# Returns a function giving the result of a stage by name (loaded on demand if cached).
+# With `instrumentation`, each stage run (cached or not) is measured and sent to its sinks.
+def run_stages(stages: list[Stage], cache: StageCache | None = None,
+               instrumentation: Instrumentation | None = None) -> Callable:
+    cache = cache or StageCache()
+    keys, hashes, values = {}, {}, {}
+
+    def resolve(name):
+        if name not in values:
+            values[name] = cache.load(keys[name])
+        return values[name]
+
+    try:
+        for stage in stages:
+            timer = instrumentation.start(stage.name) if instrumentation else None
+            key = _stage_key(stage, [hashes[i] for i in stage.inputs])
+            keys[stage.name] = key
+            meta = cache.meta(key)
+            if meta is not None and all(Path(p).exists() for p in stage.outputs):
+                cache.touch(key)
+                hashes[stage.name] = meta["data_hash"]
+                print(f"[{stage.name}] cached")
+                if timer:
+                    timer.done(cached=meta)
+                continue
+
+            t0 = time.perf_counter()
+            inputs = [resolve(i) for i in stage.inputs]
+            try:
+                result = stage.func(*inputs, **stage.params)
+            except BaseException as exc:
+                if timer:
+                    timer.done(inputs=inputs, error=exc)
+                raise
+            values[stage.name] = result
+            hashes[stage.name] = data_hash(result)
+            meta = {"stage": stage.name, "data_hash": hashes[stage.name]}
+            if timer:
+                record = timer.done(inputs=inputs, result=result)
+                meta.update(rows_out=record["rows_out"], counts=record["counts"])
+            cache.put(key, result, meta, keep=set(keys.values()))
+            print(f"[{stage.name}] computed in {time.perf_counter() - t0:.2f} s")
+    finally:
+        # flush the sinks even when a stage raised, so a failed run is recorded
+        if instrumentation:
+            instrumentation.close()
+    return resolve
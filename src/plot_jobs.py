@@ -0,0 +1,128 @@
+# src/plot_jobs.py
+import importlib.util
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+
+# Arrow IPC (Feather v2) files can be memory-mapped by every worker; without pyarrow the
+# frame is shared as one pickle file that each worker reads once
+SHARE_FORMAT = "arrow" if importlib.util.find_spec("pyarrow") else "pickle"
+
+_frame = None  # processed frame of the current worker (pyarrow.Table when memory-mapped)
+_source = None  # memory map backing _frame
+
+# Columns each plot reads besides datetime and the two pressures (plots not listed get all columns)
+BASE_COLUMNS = ["datetime", "pressure_ion", "pressure_conv"]
+PLOT_COLUMNS = {
+    "plot_time_with_events": [],
+    "plot_time_with_unplugged_events": ["IC_unplugged", "CC_unplugged"],
+    "plot_time_with_state_bands": ["IG_state", "session_id"],
+    "plot_anomalies": ["anomaly_if_ion", "anomaly_if_conv"],
+    "plot_tag_anomalies": ["anomaly_ion", "anomaly_conv"],
+}
+
+
+# Columns a job needs out of `available` (None = all of them)
+def _job_columns(job: dict, available: list[str]) -> list[str] | None:
+    name = job["plot"]
+    if name == "plot_time_with_tag_markers":
+        from .config import CH_TAGS
+
+        flags = [f"tag_{tag.replace(' ', '_')}" for tag in job.get("tags_to_mark", CH_TAGS)]
+        # tags without a binary column are looked up in tag_list
+        extra = flags + ["tag_list"] * any(flag not in available for flag in flags)
+    elif name in PLOT_COLUMNS:
+        extra = PLOT_COLUMNS[name]
+    else:
+        return None
+    return [c for c in BASE_COLUMNS + extra if c in available]
+
+
+def _share_frame(df: pd.DataFrame, folder: Path) -> Path:
+    if SHARE_FORMAT == "arrow":
+        import pyarrow as pa
+        path = folder / "frame.arrow"
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        path = folder / "frame.pkl"
+        df.to_pickle(path)
+    return path
+
+
+def _init_worker(path: Path):
+    global _frame, _source
+    from . import plotting
+
+    plotting.set_headless()
+    if path.suffix == ".arrow":
+        import pyarrow as pa
+
+        # the table only references the mapped pages; nothing is copied until a job converts it
+        _source = pa.memory_map(str(path))
+        _frame = pa.ipc.open_file(_source).read_all()
+    else:
+        _frame = pd.read_pickle(path)
+
+
+# The rows (start/end bounds) and columns a job needs as a DataFrame. From the mapped Arrow
+# table only those columns are converted, without copies where the dtype allows.
+def _job_frame(job: dict) -> pd.DataFrame:
+    start, end = job.get("start"), job.get("end")
+    if isinstance(_frame, pd.DataFrame):
+        df = _frame
+    else:
+        columns = _job_columns(job, _frame.column_names)
+        table = _frame.select(columns) if columns is not None else _frame
+        if start is not None or end is not None:
+            import pyarrow as pa
+
+            dt = _frame.column("datetime").to_pandas()
+            mask = (dt >= pd.Timestamp(start or dt.min())) & (dt <= pd.Timestamp(end or dt.max()))
+            table, start, end = table.filter(pa.array(mask.to_numpy())), None, None
+        df = table.to_pandas(split_blocks=True)
+    if start is not None or end is not None:
+        dt = df["datetime"]
+        df = df[(dt >= pd.Timestamp(start or dt.min())) & (dt <= pd.Timestamp(end or dt.max()))]
+    return df
+
+
+# One job: {"plot": name of a src.plotting function, optional "start"/"end" datetime bounds,
+# every other key is passed to the function (title, savepath, ...)}
+def _render(job: dict) -> tuple[str, float]:
+    from . import plotting
+
+    kwargs = {k: v for k, v in job.items() if k not in ("plot", "start", "end")}
+    df = _job_frame(job)
+    t0 = time.perf_counter()
+    getattr(plotting, job["plot"])(df, **kwargs)
+    return str(kwargs.get("savepath")), time.perf_counter() - t0
+
+
+# Render plot jobs in a pool of headless workers. The frame is written once to a shared
+# file and memory-mapped by each worker instead of being pickled into every job; each job
+# converts only the columns its plot reads.
+def render_plots(df: pd.DataFrame, jobs: list[dict], n_jobs: int | None = None) -> list[tuple[str, float]]:
+    global _frame
+    n_jobs = min(n_jobs or os.cpu_count(), len(jobs))
+    if n_jobs <= 1:
+        from . import plotting
+
+        plotting.set_headless()
+        _frame = df
+        try:
+            results = [_render(job) for job in jobs]
+        finally:
+            _frame = None
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = _share_frame(df, Path(tmp))
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(path,)) as pool:
+                results = list(pool.map(_render, jobs))
+    for savepath, seconds in results:
+        print(f"Rendered {savepath} in {seconds:.2f} s")
+    return results
@@ -1,11 +1,72 @@
 # src/plotting.py
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import PolyCollection
 from matplotlib.patches import Patch
-import seaborn as sns
 from pathlib import Path
+import numpy as np
 import pandas as pd
-from .config import IG_TAGS, CG_TAGS, CH_TAGS, NUMERIC_COLS
+from .config import IG_TAGS, CG_TAGS, CH_TAGS, NUMERIC_COLS, PLOT_MAX_BUCKETS, PLOT_HEADLESS
+from .tags import state_runs
+
+_headless = False
+_max_buckets = PLOT_MAX_BUCKETS
+
+
+# Headless mode: render with Agg and only write files, never open a window
+def set_headless(enabled: bool = True):
+    global _headless
+    _headless = enabled
+    if enabled:
+        plt.switch_backend("Agg")
+
+
+set_headless(PLOT_HEADLESS)
+
+
+# Number of runs lines are decimated to (None draws every sample)
+def set_decimation(buckets: int | None = PLOT_MAX_BUCKETS):
+    global _max_buckets
+    _max_buckets = buckets
+
+
+# Row positions that preserve the shape of a line at screen resolution: the rows are cut
+# into `buckets` equal runs and the first, last, min and max sample of each run are kept
+# (min/max per pixel column). Short series are returned whole.
+def decimate(y, buckets: int | None = PLOT_MAX_BUCKETS) -> np.ndarray:
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if not buckets or n <= 4 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    runs = padded.reshape(buckets, size)
+    valid = ~np.isnan(runs)
+    base = np.arange(buckets) * size
+    lo = base + np.argmin(np.where(valid, runs, np.inf), axis=1)
+    hi = base + np.argmax(np.where(valid, runs, -np.inf), axis=1)
+    keep = np.concatenate([base, np.minimum(base + size - 1, n - 1), lo, hi])
+    keep = np.unique(keep[keep < n])
+    # keep the first NaN of each gap so the line still breaks there
+    nan = np.isnan(y)
+    return np.union1d(keep, np.flatnonzero(nan & ~np.r_[False, nan[:-1]]))
+
+
+# Line of one pressure column against datetime, decimated for long series
+def _plot_line(ax, df: pd.DataFrame, col: str, **kwargs):
+    idx = decimate(df[col].to_numpy(dtype=float, na_value=np.nan), _max_buckets)
+    return ax.plot(df["datetime"].to_numpy()[idx], df[col].to_numpy()[idx], **kwargs)
+
+
+def _save_and_show(savepath: Path | None):
+    if savepath:
+        savepath.parent.mkdir(parents=True, exist_ok=True)
+        plt.savefig(savepath, dpi=150, bbox_inches="tight")
+    if not _headless:
+        plt.show()
+    plt.close()
+
 def _format_time_axis(ax):
     locator = mdates.AutoDateLocator(minticks=4, maxticks=8)
     formatter = mdates.ConciseDateFormatter(locator)
@@ -14,8 +75,8 @@ def _format_time_axis(ax):
 
 def plot_time_with_events(df: pd.DataFrame, savepath: Path | None = None):
     fig, ax = plt.subplots(figsize=(12, 5))
-    ax.plot(df["datetime"], df["pressure_conv"], label="Convectron", lw=2)
-    ax.plot(df["datetime"], df["pressure_ion"], label="Ion", lw=2, alpha=0.9)
+    _plot_line(ax, df, "pressure_conv", label="Convectron", lw=2)
+    _plot_line(ax, df, "pressure_ion", label="Ion", lw=2, alpha=0.9)
     ax.set_yscale("log")
     ax.set_ylabel("Pressure (Torr, log)")
     ax.set_title("Ion and Convectron Pressure Over Time")
@@ -24,17 +85,13 @@ def plot_time_with_events(df: pd.DataFrame, savepath: Path | None = None):
     ax.legend(loc="upper right")
     plt.grid(True, which='both', linestyle='--', linewidth=0.5)
     plt.tight_layout()
-    if savepath:
-        savepath.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(savepath, dpi=150, bbox_inches="tight")
-    plt.show()
-    plt.close()
+    _save_and_show(savepath)
 
 
 def plot_time_with_unplugged_events(df: pd.DataFrame, savepath: Path | None = None): 
     fig, ax = plt.subplots(figsize=(12, 6))
-    ax.plot(df["datetime"], df["pressure_conv"], label="Convectron")
-    ax.plot(df["datetime"], df["pressure_ion"], label="Ion")
+    _plot_line(ax, df, "pressure_conv", label="Convectron")
+    _plot_line(ax, df, "pressure_ion", label="Ion")
 
     # IC markers
     ic_unplugged = df[df["IC_unplugged"]]
@@ -58,26 +115,26 @@ def plot_time_with_unplugged_events(df: pd.DataFrame, savepath: Path | None = No
     ax.legend(loc="upper right")
     plt.grid(True, which='both', linestyle='--', linewidth=0.5)
     plt.tight_layout()
-    if savepath:
-        savepath.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(savepath, dpi=150, bbox_inches="tight")
-    plt.show()
+    _save_and_show(savepath)
 
 
 
 
-def _contiguous_runs(df: pd.DataFrame, state_col: str = "IG_state"):
-    states = df[state_col].fillna("IG unknown").to_numpy()
-    if len(states) == 0:
-        return []
-    runs = []
-    start = 0
-    for i in range(1, len(states)):
-        if states[i] != states[i - 1]:
-            runs.append((df["datetime"].iloc[start], df["datetime"].iloc[i - 1], states[i - 1]))
-            start = i
-    runs.append((df["datetime"].iloc[start], df["datetime"].iloc[len(states) - 1], states[-1]))
-    return runs
+# Background bands for the runs of a state column, drawn as one PolyCollection spanning
+# the full axis height (x in data, y in axes coordinates)
+def _state_bands(ax, df: pd.DataFrame, state_col: str, state_colors: dict, alpha: float = 0.25):
+    runs = state_runs(df, state_col)
+    x0 = mdates.date2num(runs["start"].to_numpy())
+    x1 = mdates.date2num(runs["end"].to_numpy())
+    verts = np.stack([
+        np.column_stack([x0, np.zeros_like(x0)]), np.column_stack([x0, np.ones_like(x0)]),
+        np.column_stack([x1, np.ones_like(x1)]), np.column_stack([x1, np.zeros_like(x1)]),
+    ], axis=1)
+    colors = [state_colors.get(st, "#dddddd") for st in runs["state"].astype(object)]
+    bands = PolyCollection(verts, facecolors=colors, alpha=alpha, linewidths=0,
+                           transform=ax.get_xaxis_transform())
+    ax.add_collection(bands, autolim=False)
+    return bands
 
 
 def plot_time_with_state_bands(df: pd.DataFrame, title: str, savepath: Path | None = None):
@@ -93,12 +150,11 @@ def plot_time_with_state_bands(df: pd.DataFrame, title: str, savepath: Path | No
     fig, ax = plt.subplots(figsize=(12, 5))
 
     # Background bands for IG_state
-    for t0, t1, st in _contiguous_runs(df, "IG_state"):
-        ax.axvspan(t0, t1, color=state_colors.get(st, "#dddddd"), alpha=0.25, lw=0)
+    _state_bands(ax, df, "IG_state", state_colors)
 
     # Pressure lines
-    ax.plot(df["datetime"], df["pressure_conv"], label="Convectron", lw=2)
-    ax.plot(df["datetime"], df["pressure_ion"], label="Ion", lw=2, alpha=0.9)
+    _plot_line(ax, df, "pressure_conv", label="Convectron", lw=2)
+    _plot_line(ax, df, "pressure_ion", label="Ion", lw=2, alpha=0.9)
 
     ax.set_yscale("log")
     ax.set_ylabel("Pressure (Torr, log)")
@@ -113,23 +169,22 @@ def plot_time_with_state_bands(df: pd.DataFrame, title: str, savepath: Path | No
     
     plt.grid(True, which='both', linestyle='--', linewidth=0.5)
     
-    if savepath:
-        savepath.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(savepath, dpi=150, bbox_inches="tight")
-    plt.show()
+    _save_and_show(savepath)
 
 
 
 def plot_time_with_tag_markers(df: pd.DataFrame, tags_to_mark=CH_TAGS, title: str = "Pressures with tag markers", savepath: Path | None = None):
     fig, ax = plt.subplots(figsize=(12, 5))
-    ax.plot(df["datetime"], df["pressure_conv"], label="Convectron", lw=2)
-    ax.plot(df["datetime"], df["pressure_ion"], label="Ion", lw=2, alpha=0.9)
-
-    exploded = df[["datetime", "pressure_conv", "pressure_ion", "tag_list"]].explode("tag_list")
-    exploded = exploded[exploded["tag_list"].isin(tags_to_mark)]
+    _plot_line(ax, df, "pressure_conv", label="Convectron", lw=2)
+    _plot_line(ax, df, "pressure_ion", label="Ion", lw=2, alpha=0.9)
 
     for tag in tags_to_mark:
-        sub = exploded[exploded["tag_list"] == tag]
+        flag = f"tag_{tag.replace(' ', '_')}"
+        if flag in df.columns:
+            sub = df[df[flag] == 1]
+        else:
+            # tag outside the binary vocabulary: needs tag_events(..., keep_tag_list=True)
+            sub = df[df["tag_list"].apply(lambda L: tag in L)]
         ax.scatter(sub["datetime"], sub["pressure_conv"], label=f"{tag} (conv)", s=30, marker="o")
         ax.scatter(sub["datetime"], sub["pressure_ion"], label=f"{tag} (ion)", s=30, marker="x")
 
@@ -142,15 +197,12 @@ def plot_time_with_tag_markers(df: pd.DataFrame, tags_to_mark=CH_TAGS, title: st
     ax.legend(loc="upper right")
     plt.tight_layout()
     
-    if savepath:
-        savepath.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(savepath, dpi=150, bbox_inches="tight")
-    plt.show()
+    _save_and_show(savepath)
 
 def plot_anomalies(df: pd.DataFrame, title: str = "Anomaly overlay", savepath: Path | None = None):
     fig, ax = plt.subplots(figsize=(12, 5))
-    ax.plot(df["datetime"], df["pressure_conv"], label="Convectron", lw=2)
-    ax.plot(df["datetime"], df["pressure_ion"], label="Ion", lw=2, alpha=0.9)
+    _plot_line(ax, df, "pressure_conv", label="Convectron", lw=2)
+    _plot_line(ax, df, "pressure_ion", label="Ion", lw=2, alpha=0.9)
 
     # Highlight anomalies ion 
     ion_anomalies = df[df["anomaly_if_ion"] == -1]
@@ -169,16 +221,13 @@ def plot_anomalies(df: pd.DataFrame, title: str = "Anomaly overlay", savepath: P
     plt.grid(True, which='both', linestyle='--', linewidth=0.5)
     ax.legend(loc="upper right")
     plt.tight_layout()
-    if savepath:
-        savepath.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(savepath, dpi=150, bbox_inches="tight")
-    plt.show()
+    _save_and_show(savepath)
 
 
 def plot_tag_anomalies(df: pd.DataFrame, title: str = "Tagged Anomalies", savepath: Path | None = None):
     fig, ax = plt.subplots(figsize=(12, 5))
-    ax.plot(df["datetime"], df["pressure_conv"], label="Convectron", lw=2, alpha=0.8)
-    ax.plot(df["datetime"], df["pressure_ion"], label="Ion", lw=2, alpha=0.8)
+    _plot_line(ax, df, "pressure_conv", label="Convectron", lw=2, alpha=0.8)
+    _plot_line(ax, df, "pressure_ion", label="Ion", lw=2, alpha=0.8)
 
     # Map anomaly categories to colors/markers
     anomaly_styles = {
@@ -209,8 +258,4 @@ def plot_tag_anomalies(df: pd.DataFrame, title: str = "Tagged Anomalies", savepa
     plt.grid()
     ax.legend(loc="upper right")
     
-    if savepath:
-        savepath.parent.mkdir(parents=True, exist_ok=True)
-        plt.savefig(savepath, dpi=150, bbox_inches="tight")
-
-    plt.show()
+    _save_and_show(savepath)
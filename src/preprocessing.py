@@ -1,8 +1,14 @@
 # src/preprocessing.py
+import os
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from .config import NUMERIC_COLS, ROLL_WINDOWS, SLOPE_WINDOW
+from numpy.lib.stride_tricks import sliding_window_view
+from pandas.api.indexers import BaseIndexer
+from .config import (
+    NUMERIC_COLS, ROLL_WINDOWS, SLOPE_WINDOW, SESSION_GAP, PARALLEL_MIN_ROWS,
+    RESAMPLE_FREQ, IDLE_KEEP_EVERY, IDLE_LOG_TOL,
+)
 
 def drop_nonessential_cols(df: pd.DataFrame) -> pd.DataFrame:
     df = df.copy()
@@ -29,60 +35,230 @@ def basic_clean(df: pd.DataFrame) -> pd.DataFrame:
     df = drop_nonessential_cols(df)
     return df
 
+# Position of the first row of each row's session (all zeros without a session_id column)
+def _session_starts(df: pd.DataFrame) -> np.ndarray:
+    if "session_id" not in df.columns or df.empty:
+        return np.zeros(len(df), dtype=np.int64)
+    ids = df["session_id"].to_numpy()
+    pos = np.arange(len(ids))
+    is_start = np.r_[True, ids[1:] != ids[:-1]]
+    return np.maximum.accumulate(np.where(is_start, pos, 0))
+
+
+# First row of the trailing window ending at each row, never before the row's session start.
+# An int window counts samples; a time span such as "5min" covers rows in (t - window, t],
+# like pandas' time-based rolling, so it means the same real time whatever the cadence.
+def _window_starts(df: pd.DataFrame, window: int | str, session_start: np.ndarray) -> np.ndarray:
+    n = len(df)
+    if not isinstance(window, str):
+        return np.maximum(np.arange(1, n + 1) - window, session_start)
+    t = df["datetime"].to_numpy().astype("datetime64[ns]").view("int64")
+    span = pd.Timedelta(window).value
+    start = np.empty(n, dtype=np.int64)
+    bounds = np.r_[np.flatnonzero(session_start == np.arange(n)), n]
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        start[a:b] = a + np.searchsorted(t[a:b], t[a:b] - span, side="right")
+    return start
+
+
+class _WindowIndexer(BaseIndexer):
+    # Rolling windows [start[i], i] from precomputed start positions (see _window_starts)
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        return self.start.astype(np.int64), np.arange(1, num_values + 1, dtype=np.int64)
+
+
 # Calculate rolling features like mean, std, min, max for specified windows
-def _rolling_features(s: pd.Series, name: str, windows: list[int]) -> pd.DataFrame:
+# starts: window start positions per window, needed for time windows and multi-session frames
+def _rolling_features(s: pd.Series, name: str, windows: list[int | str], starts: dict | None = None) -> pd.DataFrame:
     out = {}
     for w in windows:
-        roll = s.rolling(window=w, min_periods=1)
+        window = w if starts is None else _WindowIndexer(start=starts[w])
+        roll = s.rolling(window=window, min_periods=1)
         out[f"roll{w}_mean_{name}"] = roll.mean()
         out[f"roll{w}_std_{name}"] = roll.std(ddof=0)
         out[f"roll{w}_min_{name}"] = roll.min()
         out[f"roll{w}_max_{name}"] = roll.max()
     return pd.DataFrame(out)
 
-# Calculate rolling slope (linear trend) using a simple linear regression approach
-def _rolling_slope(y: pd.Series, window: int) -> pd.Series:
-    # Linear regression slope per rolling window using simple formula
-    # slope = cov(x,y)/var(x) with x = [0..w-1]
-    w = window
-    if w < 2:
-        return pd.Series(np.nan, index=y.index)
-    x = np.arange(w)
-    x = (x - x.mean())  # center to avoid overflow
-    denom = (x**2).sum()
+# Calculate rolling slopes (linear trend) for several channels and windows at once
+# slope = cov(x,y)/var(x) with x = [0..w-1]; since sum(x - mean(x)) == 0 this is a plain
+# dot product of each window with the centered x, evaluated on a strided view of the data
+# instead of a Python callback per sample. A window containing NaN yields NaN, as does
+# any position with fewer than w samples before it (same as rolling(w, min_periods=w)),
+# counting only samples of its own session when session_start is given.
+def _rolling_slopes(frame: pd.DataFrame, windows: list[int], session_start: np.ndarray | None = None) -> dict[int, pd.DataFrame]:
+    values = frame.to_numpy(dtype=float, na_value=np.nan)
+    out = {}
+    for w in windows:
+        slopes = np.full(values.shape, np.nan)
+        if w >= 2 and len(values) >= w:
+            x = np.arange(w) - (w - 1) / 2
+            strided = sliding_window_view(values, w, axis=0)  # (n - w + 1, channels, w)
+            slopes[w - 1:] = strided @ x / (x**2).sum()
+            if session_start is not None:
+                slopes[np.arange(len(values)) - session_start < w - 1] = np.nan
+        out[w] = pd.DataFrame(slopes, index=frame.index, columns=frame.columns)
+    return out
+
+# Seconds since the start of each row's session
+def _elapsed_seconds(df: pd.DataFrame, session_start: np.ndarray) -> np.ndarray:
+    t = df["datetime"].to_numpy().astype("datetime64[ns]").view("int64")
+    return (t - t[session_start]) / 1e9
 
-    def slope_window(vals):
-        if np.isnan(vals).any():
-            vals = vals.astype(float)
-        return np.dot(vals - np.nanmean(vals), x) / denom
+# Least-squares slope per second over variable-length (time-based) windows [start[i], i].
+# Means and centered sums are accumulated one window offset at a time, each step vectorized
+# over the rows whose window reaches that far back. Only one offset's row indices exist at a
+# time, so memory stays O(rows), and no large cumulative sums lose precision.
+# NaN when the window holds a NaN, fewer than two samples or no elapsed time.
+def _rolling_time_slopes(frame: pd.DataFrame, seconds: np.ndarray, start: np.ndarray) -> pd.DataFrame:
+    y = frame.to_numpy(dtype=float, na_value=np.nan)
+    pos = np.arange(len(y))
+    length = pos - start + 1
+    max_length = length.max(initial=0)
 
-    return y.rolling(w, min_periods=w).apply(slope_window, raw=True)
+    mean_t, mean_y = np.zeros(len(y)), np.zeros(y.shape)
+    for k in range(max_length):
+        rows = pos[length > k]
+        mean_t[rows] += seconds[rows - k]
+        mean_y[rows] += y[rows - k]
+    mean_t /= np.maximum(length, 1)
+    mean_y /= np.maximum(length, 1)[:, None]
+
+    sxx, sxy = np.zeros(len(y)), np.zeros(y.shape)
+    for k in range(max_length):
+        rows = pos[length > k]
+        dt = seconds[rows - k] - mean_t[rows]
+        sxx[rows] += dt**2
+        sxy[rows] += dt[:, None] * (y[rows - k] - mean_y[rows])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = sxy / sxx[:, None]
+    slopes[sxx == 0] = np.nan
+    return pd.DataFrame(slopes, index=frame.index, columns=frame.columns)
+
+# Rolling slope of a single series
+def _rolling_slope(y: pd.Series, window: int) -> pd.Series:
+    return _rolling_slopes(y.to_frame(), [window])[window].iloc[:, 0]
 
 
+# Features are computed within each session (see assign_sessions) when df has a session_id
 def engineer_features(df: pd.DataFrame) -> pd.DataFrame:
+    session_start = _session_starts(df)
+    first_row = session_start == np.arange(len(df))
+    # plain fixed-size rolling when there is a single session and all windows count samples
+    windows = ROLL_WINDOWS + [SLOPE_WINDOW]
+    fixed = first_row.sum() <= 1 and not any(isinstance(w, str) for w in windows)
+    starts = None if fixed else {w: _window_starts(df, w, session_start) for w in windows}
+
     # Differences (first derivative)
-    df["delta_ion"] = df["pressure_ion"].diff()
-    df["delta_conv"] = df["pressure_conv"].diff()
+    df["delta_ion"] = df["pressure_ion"].diff().mask(first_row)
+    df["delta_conv"] = df["pressure_conv"].diff().mask(first_row)
 
     # Log pressures + deltas (protect against non-positive values)
     df["log_pressure_ion"] = np.log(df["pressure_ion"].where(df["pressure_ion"] > 0))
     df["log_pressure_conv"] = np.log(df["pressure_conv"].where(df["pressure_conv"] > 0))
-    df["delta_log_ion"] = df["log_pressure_ion"].diff()
-    df["delta_log_conv"] = df["log_pressure_conv"].diff()
+    df["delta_log_ion"] = df["log_pressure_ion"].diff().mask(first_row)
+    df["delta_log_conv"] = df["log_pressure_conv"].diff().mask(first_row)
 
     # Rolling stats
-    roll_ion = _rolling_features(df["pressure_ion"], "ion", ROLL_WINDOWS)
-    roll_conv = _rolling_features(df["pressure_conv"], "conv", ROLL_WINDOWS)
+    roll_ion = _rolling_features(df["pressure_ion"], "ion", ROLL_WINDOWS, starts)
+    roll_conv = _rolling_features(df["pressure_conv"], "conv", ROLL_WINDOWS, starts)
     df = pd.concat([df, roll_ion, roll_conv], axis=1)
 
     # Rolling slopes (trend per window)
-    df["slope_ion"] = _rolling_slope(df["pressure_ion"], SLOPE_WINDOW)
-    df["slope_conv"] = _rolling_slope(df["pressure_conv"], SLOPE_WINDOW)
+    pressures = df[["pressure_ion", "pressure_conv"]]
+    if isinstance(SLOPE_WINDOW, str):
+        # per second of elapsed time
+        seconds = _elapsed_seconds(df, session_start)
+        slopes = _rolling_time_slopes(pressures, seconds, starts[SLOPE_WINDOW])
+    else:
+        # per sample
+        slopes = _rolling_slopes(pressures, [SLOPE_WINDOW], None if fixed else session_start)[SLOPE_WINDOW]
+    df["slope_ion"] = slopes["pressure_ion"]
+    df["slope_conv"] = slopes["pressure_conv"]
+
+    return df
+
 
+# Number sessions: a new one starts with every source log file, after a pause longer
+# than `gap` and when the clock jumps backwards
+def assign_sessions(df: pd.DataFrame, gap: str = SESSION_GAP) -> pd.DataFrame:
+    step = df["datetime"].diff()
+    new = (step > pd.Timedelta(gap)) | (step < pd.Timedelta(0))
+    if "source" in df.columns:
+        source = df["source"].astype(object)
+        new |= source != source.shift()
+    new = new.to_numpy(copy=True)
+    new[:1] = True
+    df["session_id"] = (np.cumsum(new) - 1).astype("int32")
     return df
 
 
-def preprocess(df: pd.DataFrame) -> pd.DataFrame:
+# Put every session on a uniform time grid of `freq`: numeric columns are averaged per bin,
+# the others (tags, source) take the first value and are carried across empty bins.
+# n_samples counts the raw rows per bin and is_gap flags bins without any (their readings are NaN).
+def resample_sessions(df: pd.DataFrame, freq: str = RESAMPLE_FREQ) -> pd.DataFrame:
+    step = pd.Timedelta(freq)
+    keys = [df["session_id"], df["datetime"].dt.floor(freq)]
+    values = [c for c in df.columns if c not in ("session_id", "datetime")]
+    numeric = df[values].select_dtypes("number").columns
+    grouped = df.groupby(keys, sort=False, observed=True)
+    binned = grouped[values].agg({c: "mean" if c in numeric else "first" for c in values})
+    binned["n_samples"] = grouped.size()
+
+    # Full grid from the first to the last bin of each session
+    span = binned.index.to_frame(index=False).groupby("session_id")["datetime"].agg(["min", "max"])
+    counts = ((span["max"] - span["min"]) // step + 1).to_numpy(dtype=np.int64)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    grid = pd.MultiIndex.from_arrays(
+        [np.repeat(span.index.to_numpy(), counts), np.repeat(span["min"].to_numpy(), counts) + offsets * step],
+        names=["session_id", "datetime"],
+    )
+    out = binned.reindex(grid)
+    out["n_samples"] = out["n_samples"].fillna(0).astype("int32")
+    out["is_gap"] = out["n_samples"] == 0
+    carried = [c for c in values if c not in numeric]
+    out[carried] = out[carried].groupby(level="session_id").ffill()
+    out = out.reset_index()
+    out["session_id"] = out["session_id"].astype("int32")
+    return out[[c for c in df.columns] + ["n_samples", "is_gap"]]
+
+
+# Thin out idle stretches (no tag change and |delta_log| below tol on both gauges) to one
+# sample per `keep_every` interval of each session, e.g. before model fitting.
+# Active samples are always kept.
+def downsample_idle(df: pd.DataFrame, keep_every: str = IDLE_KEEP_EVERY, tol: float = IDLE_LOG_TOL) -> pd.DataFrame:
+    active = (df["delta_log_ion"].abs() > tol) | (df["delta_log_conv"].abs() > tol)
+    if "tags" in df.columns:
+        active |= df["tags"].astype(object) != df["tags"].astype(object).shift()
+    bucket = pd.DataFrame({"session": df["session_id"], "bucket": df["datetime"].dt.floor(keep_every)})
+    return df[active.to_numpy() | ~bucket.duplicated().to_numpy()]
+
+
+# Features per session so diffs, rolling windows and slopes never span two sessions.
+# The frame is cut at session boundaries into contiguous batches that are processed in a
+# process pool; the result is the same as a serial run. n_jobs=None uses all cores for
+# frames of at least PARALLEL_MIN_ROWS rows.
+def engineer_features_by_session(df: pd.DataFrame, n_jobs: int | None = None) -> pd.DataFrame:
+    if n_jobs is None:
+        n_jobs = os.cpu_count() if len(df) >= PARALLEL_MIN_ROWS else 1
+    starts = np.flatnonzero(_session_starts(df) == np.arange(len(df)))
+    n_jobs = min(n_jobs, len(starts))
+    if n_jobs <= 1:
+        return engineer_features(df)
+
+    # ~4 batches per worker with a similar number of rows each, cut at session starts
+    targets = np.linspace(0, len(df), 4 * n_jobs + 1)[1:-1]
+    cuts = np.unique(starts[np.clip(np.searchsorted(starts, targets), 0, len(starts) - 1)])
+    bounds = [0] + [c for c in cuts if c > 0] + [len(df)]
+    batches = [df.iloc[a:b].copy() for a, b in zip(bounds[:-1], bounds[1:])]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        return pd.concat(list(pool.map(engineer_features, batches)))
+
+
+def preprocess(df: pd.DataFrame, n_jobs: int | None = None, resample: str | None = RESAMPLE_FREQ) -> pd.DataFrame:
     df = basic_clean(df)
-    df = engineer_features(df)
+    df = assign_sessions(df)
+    if resample:
+        df = resample_sessions(df, resample)
+    df = engineer_features_by_session(df, n_jobs)
     return df
\ No newline at end of file
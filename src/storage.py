@@ -0,0 +1,96 @@
+# src/storage.py
+import importlib.util
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from .config import PROCESSED_FORMAT, PROCESSED_PARTITION, PROCESSED_COMPRESSION, PROCESSED_ROW_GROUP_ROWS
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+
+# File the processed frame is written to for a format: `path` with the format's suffix
+# (CSV when pyarrow is missing)
+def processed_path(path: Path, fmt: str = PROCESSED_FORMAT) -> Path:
+    if fmt not in SUFFIXES:
+        raise ValueError(f"fmt must be one of {list(SUFFIXES)}, got {fmt!r}")
+    if fmt != "csv" and not HAS_PYARROW:
+        fmt = "csv"
+    return Path(path).with_suffix(SUFFIXES[fmt])
+
+
+# Row positions where a new partition (session or calendar day) starts
+def _partition_starts(df: pd.DataFrame, partition_by: str | None) -> list[int]:
+    if partition_by is None or df.empty:
+        return [0]
+    if partition_by == "session":
+        keys = df["session_id"] if "session_id" in df.columns else df["source"]
+    elif partition_by == "date":
+        keys = df["datetime"].dt.normalize()
+    else:
+        raise ValueError(f"partition_by must be 'session', 'date' or None, got {partition_by!r}")
+    keys = keys.to_numpy()
+    return [0] + (np.flatnonzero(keys[1:] != keys[:-1]) + 1).tolist()
+
+
+# Write the processed frame as Parquet or Arrow IPC (Feather v2) with one or more row groups
+# (record batches) per session or day, so readers can skip whole partitions by their
+# datetime statistics. Lists (tag_list) and categoricals keep their type. CSV is an export only.
+def write_processed(df: pd.DataFrame, path: Path, fmt: str = PROCESSED_FORMAT,
+                    partition_by: str | None = PROCESSED_PARTITION,
+                    compression: str | None = PROCESSED_COMPRESSION,
+                    max_rows: int = PROCESSED_ROW_GROUP_ROWS) -> Path:
+    path = processed_path(path, fmt)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".csv":
+        df.to_csv(path, index=False)
+        return path
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    bounds = _partition_starts(df, partition_by) + [len(df)]
+    parts = [table.slice(start, min(max_rows, hi - start))
+             for lo, hi in zip(bounds[:-1], bounds[1:]) for start in range(lo, hi, max_rows)]
+    if path.suffix == ".parquet":
+        with pq.ParquetWriter(path, table.schema, compression=compression) as writer:
+            for part in parts:
+                writer.write_table(part, row_group_size=max_rows)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            for part in parts:
+                writer.write_table(part, max_chunksize=max_rows)
+    return path
+
+
+# Load selected columns of a processed file, optionally restricted to [start, end] and to
+# some sessions. For Parquet the filters are pushed down: row groups whose datetime range
+# or session ids do not match are never read.
+def read_processed(path: Path, columns: list[str] | None = None, start=None, end=None,
+                   sessions: list[int] | None = None) -> pd.DataFrame:
+    path = Path(path)
+    if path.suffix == ".csv":
+        df = pd.read_csv(path, parse_dates=["datetime"])
+        if start is not None:
+            df = df[df["datetime"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["datetime"] <= pd.Timestamp(end)]
+        if sessions is not None:
+            df = df[df["session_id"].isin(sessions)]
+        return (df[columns] if columns is not None else df).reset_index(drop=True)
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet" if path.suffix == ".parquet" else "ipc")
+    expr = None
+    for cond in (
+        ds.field("datetime") >= pa.scalar(pd.Timestamp(start)) if start is not None else None,
+        ds.field("datetime") <= pa.scalar(pd.Timestamp(end)) if end is not None else None,
+        ds.field("session_id").isin(sessions) if sessions is not None else None,
+    ):
+        if cond is not None:
+            expr = cond if expr is None else expr & cond
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
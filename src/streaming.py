@@ -0,0 +1,52 @@
+# src/streaming.py
+import pandas as pd
+from .config import ROLL_WINDOWS, SLOPE_WINDOW
+from .preprocessing import basic_clean, assign_sessions, engineer_features_by_session
+
+# What the ring buffer keeps per row: the pressures plus what is needed to find session boundaries
+TAIL_COLS = ["datetime", "source", "session_id", "pressure_ion", "pressure_conv"]
+
+
+# Incremental `preprocess` for rows arriving from a live log. Only the last `history`
+# pressures per channel (all rows within the longest span for time windows) are kept, so a
+# new sample costs the same however much data came before it. Concatenated `update` outputs
+# equal `preprocess` on all rows (up to pandas' rolling rounding); RESAMPLE_FREQ is batch-only.
+class StreamingFeatureEngine:
+    def __init__(self):
+        # longest look-back of any feature; diffs need at least the previous row
+        windows = ROLL_WINDOWS + [SLOPE_WINDOW]
+        self.history = max([w for w in windows if not isinstance(w, str)] + [2]) - 1
+        self.time_history = max([pd.Timedelta(w) for w in windows if isinstance(w, str)], default=None)
+        self._tail = pd.DataFrame()
+        self.rows_seen = 0
+
+    def update(self, rows) -> pd.DataFrame:
+        # rows: one raw record (dict), a list of records or a DataFrame micro-batch
+        if isinstance(rows, dict):
+            rows = [rows]
+        batch = basic_clean(pd.DataFrame(rows).reset_index(drop=True))
+        if batch.empty:
+            return batch
+
+        # Run the batch session/feature code over [ring buffer + new rows] and keep the new rows
+        context = self._tail
+        if len(context):
+            offset = int(context["session_id"].iloc[0])
+            full = pd.concat([context.drop(columns="session_id"), batch], ignore_index=True)
+        else:
+            offset, full = 0, batch
+        full = assign_sessions(full)
+        full["session_id"] += offset
+        feats = engineer_features_by_session(full, n_jobs=1).iloc[len(context):]
+
+        index = pd.RangeIndex(self.rows_seen, self.rows_seen + len(batch))
+        added = [c for c in feats.columns if c not in batch.columns]
+        out = pd.concat([batch.set_axis(index), feats[added].set_axis(index)], axis=1)
+
+        keep = self.history
+        if self.time_history is not None:
+            # rows a later sample's time window (t - span, t] can still reach
+            keep = max(keep, int((full["datetime"] > full["datetime"].iloc[-1] - self.time_history).sum()))
+        self._tail = full[[c for c in TAIL_COLS if c in full.columns]].iloc[-keep:].reset_index(drop=True)
+        self.rows_seen += len(batch)
+        return out
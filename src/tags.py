@@ -1,61 +1,86 @@
 # src/tags.py
+import numpy as np
 import pandas as pd
 from collections import Counter
-from .config import IG_TAGS, CG_TAGS, CH_TAGS
-from sklearn.preprocessing import MultiLabelBinarizer
+from .config import IG_TAGS, CG_TAGS, CH_TAGS, STATE_CATEGORIES, TAG_FLAG_DTYPE
+
+ALL_TAGS = IG_TAGS + CG_TAGS + CH_TAGS
+TAG_COLUMNS = [f"tag_{tag.replace(' ', '_')}" for tag in ALL_TAGS]
+STATE_TAGS = {"IG_state": IG_TAGS, "CG_state": CG_TAGS, "CH_state": CH_TAGS}
+
+
+def _split(s: str) -> list[str]:
+    return [t.strip() for t in s.split(",") if t.strip()]
+
+
+# Index of distinct tag combinations: the combination strings and, per row, the position of
+# its combination (-1 for missing tags). Logs only contain a few dozen distinct strings, so
+# everything below is computed once per combination instead of once per row.
+def tag_index(df: pd.DataFrame) -> tuple[pd.Index, np.ndarray]:
+    tags = df["tags"]
+    if not isinstance(tags.dtype, pd.CategoricalDtype):
+        tags = tags.astype("category")
+    return tags.cat.categories, tags.cat.codes.to_numpy()
+
+
+# One row per combination (plus a last row for missing tags): tag list, binary flags and states.
+# A state is the first tag of its group in IG_TAGS / CG_TAGS / CH_TAGS order, else the fallback.
+def tag_lookup(combos: pd.Index) -> pd.DataFrame:
+    lists = [_split(s) for s in combos] + [[]]
+    table = pd.DataFrame(
+        np.array([[tag in L for tag in ALL_TAGS] for L in lists], dtype=TAG_FLAG_DTYPE),
+        columns=TAG_COLUMNS,
+    )
+    for col, group in STATE_TAGS.items():
+        fallback = STATE_CATEGORIES[col][-1]
+        table[col] = [next((tag for tag in group if tag in L), fallback) for L in lists]
+    table["tag_list"] = pd.Series(lists, dtype=object)
+    return table
+
+
+# Broadcast the lookup rows to all samples through the combination codes
+def _broadcast(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    combos, codes = tag_index(df)
+    table = tag_lookup(combos)
+    rows = np.where(codes < 0, len(combos), codes)
+    out = {}
+    for col in columns:
+        if col in STATE_CATEGORIES:
+            state_codes = pd.Index(STATE_CATEGORIES[col]).get_indexer(table[col])
+            out[col] = pd.Categorical.from_codes(state_codes[rows], categories=STATE_CATEGORIES[col])
+        else:
+            out[col] = table[col].to_numpy()[rows]
+    return pd.DataFrame(out, index=df.index)
+
 
 # Parse tags into list
 def parse_tags(df: pd.DataFrame) -> pd.DataFrame:
-    df["tag_list"] = df["tags"].fillna("").apply(
-        lambda s: [t.strip() for t in s.split(",") if t.strip()]
-    )
+    df["tag_list"] = _broadcast(df, ["tag_list"])["tag_list"]
     return df
 
 
-#  Add binary columns for using MultiLabelBinarizer from sklearn
+# Add binary columns, one per known tag
 def add_tag_binaries(df: pd.DataFrame) -> pd.DataFrame:
-    mlb = MultiLabelBinarizer(classes=IG_TAGS + CG_TAGS + CH_TAGS)
-    binary_matrix = mlb.fit_transform(df["tag_list"])
-    
-    # Build DataFrame with proper column names
-    binary_df = pd.DataFrame(
-        binary_matrix,
-        columns=[f"tag_{tag.replace(' ', '_')}" for tag in mlb.classes_],
-        index=df.index
-    )
-    return pd.concat([df, binary_df], axis=1)
+    return pd.concat([df, _broadcast(df, TAG_COLUMNS)], axis=1)
 
 
 # Derive IG_state, CG_state & CH_state from tags
 def derive_states(df: pd.DataFrame) -> pd.DataFrame:
-    def ig_state(L):
-        for tag in IG_TAGS:
-            if tag in L:
-                return tag
-        return "IG unknown"
-
-    def cg_state(L):
-        for tag in CG_TAGS:
-            if tag in L:
-                return tag
-        return "CG unknown"
-    
-    def ch_state(L):
-        for tag in CH_TAGS:
-            if tag in L:
-                return tag
-        return "CH normal"
-
-    df["IG_state"] = df["tag_list"].apply(ig_state)
-    df["CG_state"] = df["tag_list"].apply(cg_state)
-    df["CH_state"] = df["tag_list"].apply(ch_state)
+    states = _broadcast(df, list(STATE_TAGS))
+    for col in STATE_TAGS:
+        df[col] = states[col]
     return df
 
 
 # Tag frequencies
 def tag_frequencies(df: pd.DataFrame) -> pd.DataFrame:
-    all_tags = [t for L in df["tag_list"] for t in L]
-    counts = Counter(all_tags)
+    combos, codes = tag_index(df)
+    per_combo = np.bincount(codes[codes >= 0], minlength=len(combos))
+    counts = Counter()
+    for combo, n in zip(combos, per_combo):
+        for tag in _split(combo):
+            counts[tag] += int(n)
+    counts = {tag: n for tag, n in counts.items() if n > 0}
     return (
         pd.DataFrame(counts.items(), columns=["Tag", "Count"])
         .sort_values("Count", ascending=False)
@@ -65,13 +90,56 @@ def tag_frequencies(df: pd.DataFrame) -> pd.DataFrame:
 
 # Combination counts (exact matches, order matters)
 def combo_counts(df: pd.DataFrame) -> pd.DataFrame:
-    cc = df["tags"].value_counts().reset_index()
+    combos, codes = tag_index(df)
+    cc = pd.Series(np.bincount(codes[codes >= 0], minlength=len(combos)), index=combos)
+    cc = cc[cc > 0].sort_values(ascending=False, kind="stable").reset_index()
     cc.columns = ["Tag combination", "Count"]
     return cc
 
-def tag_events(df: pd.DataFrame) -> pd.DataFrame:
-    # Convenience wrapper: parse -> binaries -> states
-    df = parse_tags(df)
-    df = add_tag_binaries(df)
-    df = derive_states(df)
-    return df
\ No newline at end of file
+
+# Run-length encoding of a state column: one row per stretch of consecutive samples with the
+# same state (missing values count as the column's fallback state). A run also ends at a
+# session boundary when df has a session_id, so runs never span a gap between logs.
+def state_runs(df: pd.DataFrame, state_col: str = "IG_state") -> pd.DataFrame:
+    fallback = STATE_CATEGORIES.get(state_col, ["unknown"])[-1]
+    states = df[state_col]
+    if isinstance(states.dtype, pd.CategoricalDtype) and fallback not in states.cat.categories:
+        states = states.cat.add_categories(fallback)
+    codes, uniques = pd.factorize(states.fillna(fallback))
+    change = codes[1:] != codes[:-1]
+    if "session_id" in df.columns:
+        sessions = df["session_id"].to_numpy()
+        change |= sessions[1:] != sessions[:-1]
+    starts = np.r_[0, np.flatnonzero(change) + 1] if len(codes) else np.array([], dtype=np.int64)
+    ends = np.r_[starts[1:] - 1, len(codes) - 1] if len(codes) else starts
+    times = df["datetime"].to_numpy()
+    runs = pd.DataFrame({
+        "start": times[starts],
+        "end": times[ends],
+        "state": pd.Categorical(np.asarray(uniques)[codes[starts]], categories=STATE_CATEGORIES.get(state_col)),
+        "n_samples": ends - starts + 1,
+    })
+    runs["duration_s"] = (runs["end"] - runs["start"]).dt.total_seconds()
+    return runs
+
+
+# Runs of several state columns in one long table (state_col, start, end, state, ...),
+# written as Parquet for a .parquet path and as CSV otherwise
+def export_state_runs(df: pd.DataFrame, path, state_cols=tuple(STATE_TAGS)) -> pd.DataFrame:
+    table = pd.concat(
+        [state_runs(df, col).astype({"state": object}).assign(state_col=col) for col in state_cols if col in df.columns],
+        ignore_index=True,
+    )
+    table = table[["state_col", "start", "end", "state", "n_samples", "duration_s"]]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".parquet":
+        table.to_parquet(path, index=False)
+    else:
+        table.to_csv(path, index=False)
+    return table
+
+
+def tag_events(df: pd.DataFrame, keep_tag_list: bool = False) -> pd.DataFrame:
+    # Convenience wrapper: binaries + states (+ optional tag lists) from one lookup table
+    columns = (["tag_list"] if keep_tag_list else []) + TAG_COLUMNS + list(STATE_TAGS)
+    return pd.concat([df, _broadcast(df, columns)], axis=1)
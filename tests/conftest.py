@@ -0,0 +1,23 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.synthetic_logs import write_synthetic_logs  # noqa: E402
+from src.data_loader import read_log  # noqa: E402
+
+
+# Small synthetic raw logs (several sessions) written to a temporary folder
+@pytest.fixture
+def raw_logs(tmp_path) -> list[Path]:
+    return write_synthetic_logs(3000, tmp_path / "raw", files=3)
+
+
+# The raw logs parsed and concatenated like load_all_csv does
+@pytest.fixture
+def raw_frame(raw_logs) -> pd.DataFrame:
+    return pd.concat([read_log(f).assign(source=f.stem) for f in raw_logs], ignore_index=True)
@@ -0,0 +1,48 @@
+# tests/test_anomaly_detection.py
+import re
+import numpy as np
+import pandas as pd
+import pytest
+from src.anomaly_detection import fit_models, score
+from src.preprocessing import preprocess
+from src.tags import tag_events
+
+
+# The synthetic logs with features and tags, ready for fit_models
+@pytest.fixture
+def tagged(raw_frame) -> pd.DataFrame:
+    return tag_events(preprocess(raw_frame, n_jobs=1))
+
+
+# (fitted, unchanged) forests reported by the last fit_models call
+def _fitted(capsys) -> tuple[int, int]:
+    fitted, unchanged = re.findall(r"Forests: (\d+) fitted, (\d+) unchanged", capsys.readouterr().out)[-1]
+    return int(fitted), int(unchanged)
+
+
+# Forests are loaded back while their training rows are unchanged; rows appended to one regime
+# refit only that regime's forests
+def test_forests_refit_only_changed_regimes(tagged, tmp_path, capsys):
+    cache = tmp_path / "forests"
+    models = fit_models(tagged, cache_dir=cache, n_jobs=1)
+    n_forests = sum(len(entry["regimes"]) + 1 for entry in models.values())
+    assert _fitted(capsys) == (n_forests, 0)
+
+    fit_models(tagged, cache_dir=cache, n_jobs=1)
+    assert _fitted(capsys) == (0, n_forests)
+
+    regime = tagged.groupby(["IG_state", "CG_state"], observed=True).size().idxmax()
+    rows = tagged[(tagged["IG_state"] == regime[0]) & (tagged["CG_state"] == regime[1])].tail(50)
+    fit_models(pd.concat([tagged, rows], ignore_index=True), cache_dir=cache, n_jobs=1)
+    channels = sum("|".join(regime) in entry["regimes"] for entry in models.values())
+    assert channels > 0
+    assert _fitted(capsys) == (channels, n_forests - channels)
+
+
+# Scoring in chunks gives the same decisions as scoring all rows at once
+def test_chunked_scoring_matches(tagged):
+    models = fit_models(tagged, n_jobs=1)
+    whole = score(tagged.copy(), models, chunk_rows=len(tagged))
+    chunked = score(tagged.copy(), models, chunk_rows=333)
+    for channel in models:
+        np.testing.assert_array_equal(chunked[f"score_if_raw_{channel}"], whole[f"score_if_raw_{channel}"])
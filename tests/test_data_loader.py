@@ -0,0 +1,60 @@
+# tests/test_data_loader.py
+import pandas as pd
+import src.data_loader as data_loader
+from src.data_loader import _load_cached, _update_cache, _update_export, apply_schema
+
+
+# read_log wrapper recording the name of every file parsed
+def _count_reads(monkeypatch) -> list[str]:
+    parsed, read_log = [], data_loader.read_log
+    monkeypatch.setattr(data_loader, "read_log", lambda f: parsed.append(f.name) or read_log(f))
+    return parsed
+
+
+# Drop the last data line of a raw log (changes its size and mtime)
+def _truncate(path) -> None:
+    lines = path.read_text().splitlines(keepends=True)
+    path.write_text("".join(lines[:-1]))
+
+
+# Only new or changed logs are parsed again; removed logs leave the cache
+def test_cache_reparses_only_changed_files(raw_logs, raw_frame, tmp_path, monkeypatch):
+    cache = tmp_path / "cache"
+    parsed = _count_reads(monkeypatch)
+    first = pd.concat(_load_cached(raw_logs, cache), ignore_index=True)
+    assert parsed == [f.name for f in raw_logs]
+    pd.testing.assert_frame_equal(apply_schema(first), apply_schema(raw_frame))
+
+    parsed.clear()
+    _load_cached(raw_logs, cache)
+    assert parsed == []
+
+    _truncate(raw_logs[1])
+    dfs = _load_cached(raw_logs, cache)
+    assert parsed == [raw_logs[1].name]
+    assert len(dfs[1]) == len(data_loader.read_log(raw_logs[1]))
+
+    parsed.clear()
+    pieces = _update_cache(raw_logs[:2], cache)
+    assert parsed == []
+    assert sorted(p.name for p in cache.glob(f"*.{data_loader.CACHE_FORMAT}")) == sorted(p.name for p in pieces)
+
+
+# The incrementally updated export matches the logs written from scratch, and only the logs
+# from the first changed one onward are written
+def test_export_matches_full_rewrite(raw_logs, tmp_path, capsys):
+    cache, export, state = tmp_path / "cache", tmp_path / "merged.csv", tmp_path / "export.json"
+
+    def update(files):
+        _update_export(files, _update_cache(files, cache), export, state)
+        expected = pd.concat(_load_cached(files, cache), ignore_index=True)
+        return export.read_bytes(), apply_schema(expected).to_csv(index=False).encode()
+
+    for files, n_written in ((raw_logs[:2], 2), (raw_logs, 1), (raw_logs[:2], 0), (raw_logs, 1)):
+        written, expected = update(files)
+        assert written == expected
+        assert f"({n_written} of {len(files)} logs written)" in capsys.readouterr().out
+    _truncate(raw_logs[0])
+    written, expected = update(raw_logs)
+    assert written == expected
+    assert "(3 of 3 logs written)" in capsys.readouterr().out
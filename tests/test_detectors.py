@@ -0,0 +1,50 @@
+# tests/test_detectors.py
+import numpy as np
+import pytest
+from src.detectors import DETECTOR_TYPES, Detector, make_detector
+
+
+# Noisy feature over three sessions with a few missing readings and a drift in the middle one
+def _feature(n: int = 600, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    x = rng.normal(0, 1e-3, n)
+    x[250:300] += 5e-3
+    x[rng.choice(n, 10, replace=False)] = np.nan
+    return x, np.repeat([0, 1, 2], [200, 250, n - 450])
+
+
+# Feeding the rows in micro-batches with the carried state gives the batch result
+@pytest.mark.parametrize("name", DETECTOR_TYPES)
+def test_streaming_matches_batch(name):
+    x, ids = _feature()
+    detector = make_detector(name).fit(x)
+    batch, _ = detector.decision(x, ids)
+
+    cuts = np.r_[0, np.sort(np.random.default_rng(1).choice(np.arange(1, len(x)), 40, replace=False)), len(x)]
+    parts, state = [], None
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        out, state = detector.decision(x[a:b], ids[a:b], state)
+        parts.append(out)
+    np.testing.assert_allclose(np.concatenate(parts), batch, rtol=1e-9, atol=1e-9)
+
+
+# A new session starts from scratch instead of continuing the carried state
+@pytest.mark.parametrize("name", DETECTOR_TYPES)
+def test_state_does_not_cross_sessions(name):
+    x, ids = _feature()
+    detector = make_detector(name).fit(x)
+    _, state = detector.decision(x[:200], ids[:200])
+    carried, _ = detector.decision(x[200:450], ids[200:450], state)
+    fresh, _ = detector.decision(x[200:450], ids[200:450])
+    np.testing.assert_array_equal(carried, fresh)
+
+
+# A subclass without _session fails when created, not on its first decision
+def test_incomplete_detector_cannot_be_created():
+    class NoSession(Detector):
+        pass
+
+    with pytest.raises(TypeError):
+        NoSession()
+    with pytest.raises(ValueError):
+        make_detector("unknown")
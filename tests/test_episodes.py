@@ -0,0 +1,70 @@
+# tests/test_episodes.py
+import numpy as np
+import pandas as pd
+from src.config import STATE_CATEGORIES
+from src.episodes import EpisodeIndex, build_episodes, flag_runs
+
+
+# Runs closer than max_gap merge, but never across a session boundary
+def test_flag_runs_merge_gaps_within_sessions():
+    flag = np.array([1, 1, 0, 1, 0, 0, 0, 1, 1, 1], dtype=bool)
+    sessions = np.array([0, 0, 0, 0, 0, 0, 0, 0, 1, 1])
+    starts, ends = flag_runs(flag, max_gap=1)
+    assert starts.tolist() == [0, 7] and ends.tolist() == [3, 9]
+    starts, ends = flag_runs(flag, sessions, max_gap=1)
+    assert starts.tolist() == [0, 7, 8] and ends.tolist() == [3, 7, 9]
+    assert flag_runs(np.zeros(5, dtype=bool))[0].size == 0
+
+
+# The dominant state of an episode is the most frequent one, and none when no row has a state
+def test_episode_state_ignores_missing_states():
+    n = 12
+    ig = [None] * 4 + ["IG on", "IG on", "IG off"] + [None] * 5
+    df = pd.DataFrame({
+        "datetime": pd.date_range("2025-01-01", periods=n, freq="s"),
+        "session_id": 0,
+        "anomaly_if_ion": np.where(np.isin(np.arange(n), [1, 2, 4, 5, 6, 9, 10]), -1, 1),
+        "score_if_ion": np.arange(n, dtype=float),
+        "IG_state": pd.Categorical(ig, categories=STATE_CATEGORIES["IG_state"]),
+    })
+    episodes = build_episodes(df, max_gap=0)
+    assert episodes[["n_samples", "n_flagged"]].values.tolist() == [[2, 2], [3, 3], [2, 2]]
+    assert episodes["IG_state"].isna().tolist() == [True, False, True]
+    assert episodes["IG_state"].iloc[1] == "IG on"
+    assert episodes["states"].tolist() == ["", "IG on,IG off", ""]
+    assert episodes["peak_time"].tolist() == list(df["datetime"].iloc[[2, 6, 10]])
+
+
+# Random episode table with kinds, labels and comma-separated states
+def _random_episodes(n: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2025-01-01") + pd.to_timedelta(rng.integers(0, 10_000, n), unit="s")
+    duration = pd.to_timedelta(rng.exponential(300, n).round(), unit="s")
+    return pd.DataFrame({
+        "kind": rng.choice(["anomaly", "tag"], n), "label": rng.choice(["ion", "conv"], n),
+        "start": start, "end": start + duration, "duration_s": duration.total_seconds(),
+        "states": rng.choice(["IG on", "IG on,CG off", "CG off", ""], n), "tags": "",
+    })
+
+
+# Range, filter and overlap queries match a brute-force scan of the table
+def test_query_matches_brute_force():
+    episodes, other = _random_episodes(400, 0), _random_episodes(50, 1)
+    index = EpisodeIndex(episodes)
+    ep = index.episodes
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        a = pd.Timestamp("2025-01-01") + pd.Timedelta(seconds=int(rng.integers(-500, 10_500)))
+        b = a + pd.Timedelta(seconds=int(rng.integers(0, 2000)))
+        expected = ep[(ep["start"] <= b) & (ep["end"] >= a)]
+        pd.testing.assert_frame_equal(index.query(a, b), expected)
+        assert index.count_overlaps(np.array([a.value]), np.array([b.value]))[0] == len(expected)
+        pd.testing.assert_frame_equal(index.at(a), ep[(ep["start"] <= a) & (ep["end"] >= a)])
+
+    got = index.query(end=pd.Timestamp("2025-01-01 01:00"), kind="tag", state="CG off", min_duration="2min")
+    expected = ep[(ep["start"] <= pd.Timestamp("2025-01-01 01:00")) & (ep["kind"] == "tag")
+                  & ep["states"].str.split(",").apply(lambda s: "CG off" in s) & (ep["duration_s"] >= 120)]
+    pd.testing.assert_frame_equal(got, expected)
+
+    hits = [any((o.start <= e.end) and (o.end >= e.start) for o in other.itertuples()) for e in ep.itertuples()]
+    pd.testing.assert_frame_equal(index.query(overlaps=other), ep[np.array(hits)])
@@ -0,0 +1,48 @@
+# tests/test_live_scoring.py
+import numpy as np
+import pandas as pd
+from src.live_scoring import LogTail, warm_up_rows
+from src.preprocessing import preprocess
+from src.streaming import StreamingFeatureEngine
+
+
+# A row still being written is neither parsed by existing() nor read() until it is complete
+def test_log_tail_holds_back_partial_lines(raw_logs, tmp_path):
+    lines = raw_logs[0].read_text().splitlines(keepends=True)
+    path = tmp_path / "live.csv"
+    path.write_text("".join(lines[:6]) + lines[6][:12])
+
+    tail = LogTail(path)
+    assert len(tail.existing()) == 5
+    assert tail.read(100).empty
+    with open(path, "a") as fh:
+        fh.write(lines[6][12:] + lines[7])
+    new = tail.read(100)
+    tail.close()
+    expected = pd.read_csv(raw_logs[0], nrows=7).iloc[5:]
+    assert len(new) == 2
+    np.testing.assert_allclose(new["pressure_ion"], expected["pressure_ion"], rtol=1e-6)
+
+
+# After warming up on the end of the log, new rows get the features of the full history
+def test_warm_up_continues_features(raw_frame):
+    session = raw_frame[raw_frame["source"] == raw_frame["source"].iloc[0]].reset_index(drop=True)
+    logged, new = session.iloc[:800], session.iloc[800:900]
+    engine = StreamingFeatureEngine()
+    engine.update(warm_up_rows(logged, engine))
+    streamed = engine.update(new)
+    batch = preprocess(session.iloc[:900].copy(), n_jobs=1).iloc[800:]
+    for col in ("delta_log_ion", "roll15_mean_conv", "slope_conv"):
+        np.testing.assert_allclose(streamed[col].to_numpy(dtype=float), batch[col].to_numpy(dtype=float),
+                                   rtol=1e-6, equal_nan=True, err_msg=col)
+
+
+# Time-span windows replay every row within the longest span, not just `history` samples
+def test_warm_up_covers_time_windows(raw_frame):
+    engine = StreamingFeatureEngine()
+    engine.time_history = pd.Timedelta("10min")
+    rows = warm_up_rows(raw_frame, engine)
+    end = raw_frame["datetime"].iloc[-1]
+    assert len(rows) > engine.history
+    assert rows["datetime"].iloc[0] >= end - engine.time_history
+    assert len(rows) == (raw_frame["datetime"] >= end - engine.time_history).sum()
@@ -0,0 +1,50 @@
+# tests/test_pipeline.py
+import json
+import pandas as pd
+import pytest
+from src.instrumentation import Instrumentation, JsonLinesSink
+from src.pipeline import Stage, StageCache, run_stages
+
+
+# A loading stage and a stage scaling its result; `calls` records which functions ran
+def _stages(calls: list, scale: int = 2) -> list[Stage]:
+    def load():
+        calls.append("load")
+        return pd.DataFrame({"x": range(10)})
+
+    def double(df, factor):
+        calls.append("double")
+        return df * factor
+
+    return [Stage("load", load), Stage("double", double, inputs=["load"], params={"factor": scale})]
+
+
+# A second run with the same stages computes nothing; a changed param reruns only its stage
+def test_unchanged_stages_come_from_the_cache(tmp_path):
+    cache = StageCache(tmp_path / "cache")
+    calls = []
+    first = run_stages(_stages(calls), cache)("double")
+    assert calls == ["load", "double"]
+
+    calls.clear()
+    again = run_stages(_stages(calls), cache)("double")
+    assert calls == []
+    pd.testing.assert_frame_equal(again, first)
+
+    run_stages(_stages(calls, scale=3), cache)
+    assert calls == ["double"]
+
+
+# A stage that raises still reaches the sinks, marked failed with its error
+def test_failed_stage_is_recorded(tmp_path):
+    def fail(df):
+        raise RuntimeError("boom")
+
+    log = tmp_path / "runs.jsonl"
+    stages = [*_stages([]), Stage("fail", fail, inputs=["double"])]
+    with pytest.raises(RuntimeError):
+        run_stages(stages, StageCache(tmp_path / "cache"), Instrumentation([JsonLinesSink(log)]))
+    records = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [r["stage"] for r in records] == ["load", "double", "fail"]
+    assert records[-1]["failed"] and "boom" in records[-1]["error"]
+    assert records[1]["rows_out"] == 10 and not records[1]["failed"]
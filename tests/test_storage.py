@@ -0,0 +1,21 @@
+# tests/test_storage.py
+import pandas as pd
+import pytest
+from src.preprocessing import preprocess
+from src.storage import read_processed, write_processed
+from src.tags import tag_events
+
+pytest.importorskip("pyarrow")
+
+
+# Both columnar formats round-trip the frame and the pushed-down filters match pandas
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_round_trip_and_filters(raw_frame, tmp_path, fmt):
+    df = tag_events(preprocess(raw_frame.copy(), n_jobs=1))
+    path = write_processed(df, tmp_path / "processed", fmt, max_rows=500)
+    pd.testing.assert_frame_equal(read_processed(path), df, check_categorical=False)
+
+    start, end = df["datetime"].iloc[400], df["datetime"].iloc[2500]
+    got = read_processed(path, columns=["datetime", "pressure_ion"], start=start, end=end, sessions=[0, 2])
+    mask = (df["datetime"] >= start) & (df["datetime"] <= end) & df["session_id"].isin([0, 2])
+    pd.testing.assert_frame_equal(got, df.loc[mask, ["datetime", "pressure_ion"]].reset_index(drop=True))
@@ -0,0 +1,39 @@
+# tests/test_streaming.py
+import numpy as np
+import pandas as pd
+from src.preprocessing import preprocess
+from src.streaming import StreamingFeatureEngine
+
+
+# Equal up to the rounding pandas accumulates in its running rolling moments, relative to the
+# magnitude of the column (pressures are ~1e-7)
+def _assert_close(actual: pd.Series, expected: pd.Series, col: str):
+    expected = expected.to_numpy(dtype=float)
+    scale = np.nanmax(np.abs(expected), initial=0.0)
+    np.testing.assert_allclose(actual.to_numpy(dtype=float), expected, rtol=1e-6, atol=1e-6 * scale,
+                               equal_nan=True, err_msg=col)
+
+
+# Successive micro-batches (of uneven sizes, single rows included) give the batch features
+def test_streaming_matches_batch(raw_frame):
+    batch = preprocess(raw_frame.copy(), n_jobs=1)
+    engine = StreamingFeatureEngine()
+    sizes = np.random.default_rng(0).integers(1, 200, len(raw_frame))
+    bounds = np.r_[0, np.cumsum(sizes)]
+    parts = [engine.update(raw_frame.iloc[a:b]) for a, b in zip(bounds[:-1], bounds[1:]) if a < len(raw_frame)]
+    streamed = pd.concat(parts)
+
+    assert len(streamed) == len(batch)
+    assert list(streamed["session_id"]) == list(batch["session_id"])
+    for col in batch.columns:
+        if pd.api.types.is_float_dtype(batch[col]):
+            _assert_close(streamed[col], batch[col], col)
+
+
+def test_single_rows_match_batch(raw_frame):
+    rows = raw_frame.iloc[:300]
+    batch = preprocess(rows.copy(), n_jobs=1)
+    engine = StreamingFeatureEngine()
+    streamed = pd.concat([engine.update(rows.iloc[[i]]) for i in range(len(rows))])
+    for col in ("delta_log_ion", "roll15_std_conv", "slope_ion"):
+        _assert_close(streamed[col], batch[col], col)